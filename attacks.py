@@ -0,0 +1,154 @@
+"""
+    Attack and ray tables, built once at import.
+
+    The mailbox tables are indexed [i][j] like ChessGame.board and hold (i, j, square)
+    entries, the bitboard tables are indexed by square (a1 = 0 ... h8 = 63).
+"""
+from utils import generate_diagonal_indexes, generate_translational_indexes
+
+
+KNIGHT_OFFSETS = [[-2, 1], [-2, -1], [-1, -2], [-1, 2], [1, -2], [1, 2], [2, -1], [2, 1]]
+KING_OFFSETS = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1]]
+
+
+def pos_to_square(pos):
+    return (7 - pos[0]) * 8 + pos[1]
+
+
+def square_to_pos(square):
+    return [7 - (square >> 3), square & 7]
+
+
+def iter_squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _entry(i, j):
+    return (i, j, pos_to_square([i, j]))
+
+
+def _offset_targets(i, j, offsets):
+    return tuple(_entry(i + di, j + dj) for di, dj in offsets if 0 <= i + di <= 7 and 0 <= j + dj <= 7)
+
+
+def _straight_rays(i, j):
+    """
+        Down, up, right, left
+    """
+    vert_indexes = generate_translational_indexes(i)
+    hori_indexes = generate_translational_indexes(j)
+    rays = [tuple(_entry(y, j) for y in vert_index) for vert_index in vert_indexes]
+    rays += [tuple(_entry(i, x) for x in hori_index) for hori_index in hori_indexes]
+    return tuple(rays)
+
+
+def _diagonal_rays(i, j):
+    return tuple(tuple(_entry(y, x) for (y, x) in diagonal_index) for diagonal_index in generate_diagonal_indexes(i, j))
+
+
+KNIGHT_TARGETS = [[_offset_targets(i, j, KNIGHT_OFFSETS) for j in range(8)] for i in range(8)]
+KING_TARGETS = [[_offset_targets(i, j, KING_OFFSETS) for j in range(8)] for i in range(8)]
+STRAIGHT_RAYS = [[_straight_rays(i, j) for j in range(8)] for i in range(8)]
+DIAGONAL_RAYS = [[_diagonal_rays(i, j) for j in range(8)] for i in range(8)]
+
+# Squares a pawn of the given color must stand on to attack [i][j]
+PAWN_ATTACKERS = {
+    "W": [[_offset_targets(i, j, [[1, -1], [1, 1]]) for j in range(8)] for i in range(8)],
+    "B": [[_offset_targets(i, j, [[-1, -1], [-1, 1]]) for j in range(8)] for i in range(8)]
+}
+
+
+def _between_table():
+    """
+        BETWEEN[a][b] holds the squares strictly between two squares on a common line
+    """
+    between = [[0 for _ in range(64)] for _ in range(64)]
+    for square in range(64):
+        i, j = square_to_pos(square)
+        for ray in STRAIGHT_RAYS[i][j] + DIAGONAL_RAYS[i][j]:
+            mask = 0
+            for (_, _, target) in ray:
+                between[square][target] = mask
+                mask |= 1 << target
+    return between
+
+
+BETWEEN = _between_table()
+
+
+def _square_table(table):
+    bb_table = [0 for _ in range(64)]
+    for square in range(64):
+        i, j = square_to_pos(square)
+        for target in table[i][j]:
+            bb_table[square] |= 1 << target[2]
+    return bb_table
+
+
+KNIGHT_ATTACKS = _square_table(KNIGHT_TARGETS)
+KING_ATTACKS = _square_table(KING_TARGETS)
+PAWN_ATTACKS = {
+    "W": _square_table([[_offset_targets(i, j, [[-1, -1], [-1, 1]]) for j in range(8)] for i in range(8)]),
+    "B": _square_table([[_offset_targets(i, j, [[1, -1], [1, 1]]) for j in range(8)] for i in range(8)])
+}
+
+
+def _line_lookup(rays):
+    """
+        Sliding attacks along one line through a square, indexed by the occupancy
+        of the line's inner squares (the edge squares never block anything).
+        The dict plays the role of a magic / PEXT index.
+    """
+    relevant = 0
+    for ray in rays:
+        for (_, _, square) in ray[:-1]:
+            relevant |= 1 << square
+
+    lookup = {}
+    occupancy = 0
+    while True:
+        attacks = 0
+        for ray in rays:
+            for (_, _, square) in ray:
+                target = 1 << square
+                attacks |= target
+                if occupancy & target:
+                    break
+        lookup[occupancy] = attacks
+        occupancy = (occupancy - relevant) & relevant
+        if occupancy == 0:
+            break
+
+    return relevant, lookup
+
+
+def _line_tables(line_rays):
+    masks = [0 for _ in range(64)]
+    lookups = [None for _ in range(64)]
+    for square in range(64):
+        i, j = square_to_pos(square)
+        masks[square], lookups[square] = _line_lookup(line_rays(i, j))
+    return masks, lookups
+
+
+FILE_MASKS, FILE_ATTACKS = _line_tables(lambda i, j: STRAIGHT_RAYS[i][j][0:2])
+RANK_MASKS, RANK_ATTACKS = _line_tables(lambda i, j: STRAIGHT_RAYS[i][j][2:4])
+DIAGONAL_MASKS, DIAGONAL_ATTACKS = _line_tables(lambda i, j: DIAGONAL_RAYS[i][j][0:2])
+ANTI_DIAGONAL_MASKS, ANTI_DIAGONAL_ATTACKS = _line_tables(lambda i, j: DIAGONAL_RAYS[i][j][2:4])
+
+
+def rook_attacks(square, occupied):
+    return (FILE_ATTACKS[square][occupied & FILE_MASKS[square]] |
+            RANK_ATTACKS[square][occupied & RANK_MASKS[square]])
+
+
+def bishop_attacks(square, occupied):
+    return (DIAGONAL_ATTACKS[square][occupied & DIAGONAL_MASKS[square]] |
+            ANTI_DIAGONAL_ATTACKS[square][occupied & ANTI_DIAGONAL_MASKS[square]])
+
+
+def queen_attacks(square, occupied):
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
@@ -0,0 +1,155 @@
+"""
+    Search benchmark. Searches a fixed set of middlegame and endgame positions to a fixed
+    depth with a fresh AlphaBetaSearch each and prints a JSON report, so that engine versions
+    can be compared on the same machine by their node counts, speed and move choices.
+    The report also holds the per-move overhead of copying the game before a search,
+    ChessGame.copy against the deepcopy it replaced. With --root-split N every position is
+    searched again by a RootSplitSearch over N workers, whose time to each depth against the
+    single-process one gives its scaling efficiency.
+
+    python bench.py [--depth 4] [--bitboard] [--root-split N] [--output report.json]
+"""
+import argparse
+import json
+import platform
+import time
+from copy import deepcopy
+
+from bitboard import BitboardGame
+from chessgame import ChessGame
+from engine.alphabeta import AlphaBetaSearch
+from engine.root_split import RootSplitSearch
+from moves import move_name
+
+
+# (name, FEN)
+BENCH_POSITIONS = [
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("italian", "r1bq1rk1/pppp1ppp/2n2n2/2b1p3/2B1P3/2PP1N2/PP3PPP/RNBQ1RK1 b - - 0 6"),
+    ("queens_gambit", "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N2N2/PP2BPPP/R2QKB1R w KQ - 0 8"),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+    ("tactics", "r1b1k2r/ppppnppp/2n2q2/2b5/3NP3/2P1B3/PP3PPP/RN1QKB1R w KQkq - 0 7"),
+    ("rook_endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+    ("pawn_endgame", "8/5pk1/6p1/8/5P2/6P1/6K1/8 w - - 0 1"),
+    ("lucena", "1K1k4/1P6/8/8/8/8/r7/2R5 w - - 0 1")
+]
+
+
+def bench_position(name, fen, depth, game_class=ChessGame, max_quiescence_depth=5, aspiration_window=1000):
+    game = game_class.from_fen(fen)
+    search = AlphaBetaSearch(depth, max_quiescence_depth, aspiration_window)
+    search.verbose = False
+
+    start = time.time()
+    move = search.alpha_beta_search(game)
+    elapsed = time.time() - start
+
+    iterations = search.iterations
+    tt_probes = sum(iteration['tt_probes'] for iteration in iterations)
+    return {
+        'name': name,
+        'fen': fen,
+        'depth': search.completed_depth,
+        'best_move': move_name(move) if move is not None else None,
+        'value': search.best_value,
+        'nodes': search.nodes,
+        'time': elapsed,
+        'nps': search.nodes / max(elapsed, 1e-9),
+        'cutoffs': sum(iteration['cutoffs'] for iteration in iterations),
+        'quiescence_nodes': sum(iteration['quiescence_nodes'] for iteration in iterations),
+        'tt_hit_rate': sum(iteration['tt_hits'] for iteration in iterations) / max(tt_probes, 1),
+        'time_to_depth': [iteration['time'] for iteration in iterations]
+    }
+
+
+def copy_overhead(fen, game_class=ChessGame, repeat=100):
+    """
+        Microseconds per copy of the position, with ChessGame.copy and with deepcopy
+    """
+    game = game_class.from_fen(fen)
+    timings = {}
+    for name, copy_game in (('copy_us', game_class.copy), ('deepcopy_us', deepcopy)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            copy_game(game)
+        timings[name] = 1e6 * (time.perf_counter() - start) / repeat
+    return timings
+
+
+def bench_root_split(search, result, game_class=ChessGame):
+    """
+        Searches the position of a bench_position result with the RootSplitSearch search
+        and compares its time to every depth with the single-process one in result
+    """
+    start = time.time()
+    move = search.alpha_beta_search(game_class.from_fen(result['fen']))
+    elapsed = time.time() - start
+
+    efficiency = search.scaling_efficiency(result['time_to_depth'])
+    return {
+        'workers': search.workers,
+        'depth': search.completed_depth,
+        'best_move': move_name(move) if move is not None else None,
+        'nodes': sum(scaling[3] for scaling in search.scaling),
+        'time': elapsed,
+        'time_to_depth': [scaling[2] for scaling in search.scaling],
+        'cpu_utilization': [scaling[4] for scaling in search.scaling],
+        'scaling_efficiency': [value for (_, value) in efficiency]
+    }
+
+
+def run_bench(depth=4, game_class=ChessGame, root_split=0):
+    """
+        root_split is the number of RootSplitSearch workers, 0 leaves it out
+    """
+    results = [bench_position(name, fen, depth, game_class) for name, fen in BENCH_POSITIONS]
+    for result in results:
+        result.update(copy_overhead(result['fen'], game_class))
+    if root_split:
+        search = RootSplitSearch(depth, 5, 1000, root_split)
+        search.verbose = False
+        # Starts the pool processes, which would otherwise be charged to the first position
+        search.alpha_beta_search(game_class())
+        for result in results:
+            result['root_split'] = bench_root_split(search, result, game_class)
+        search.close()
+    nodes = sum(result['nodes'] for result in results)
+    elapsed = sum(result['time'] for result in results)
+    report = {
+        'depth': depth,
+        'game_class': game_class.__name__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'positions': results,
+        'nodes': nodes,
+        'time': elapsed,
+        'nps': nodes / max(elapsed, 1e-9),
+        'copy_us': sum(result['copy_us'] for result in results) / len(results),
+        'deepcopy_us': sum(result['deepcopy_us'] for result in results) / len(results)
+    }
+    if root_split:
+        # Over the whole suite, single-process time over workers times root split time
+        split_time = sum(result['root_split']['time'] for result in results)
+        report['root_split'] = {
+            'workers': root_split,
+            'time': split_time,
+            'scaling_efficiency': elapsed / (root_split * max(split_time, 1e-9))
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fixed depth search benchmark")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--bitboard", action="store_true", help="search with BitboardGame instead of ChessGame")
+    parser.add_argument("--root-split", type=int, default=0, metavar="N",
+                        help="also search every position with a RootSplitSearch over N workers")
+    parser.add_argument("--output", help="write the report to this file instead of printing it")
+    args = parser.parse_args()
+
+    report = run_bench(args.depth, BitboardGame if args.bitboard else ChessGame, args.root_split)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -1,13 +1,52 @@
+from attacks import DIAGONAL_RAYS, STRAIGHT_RAYS, pos_to_square
 from pieces import Piece, ChessPiece
-from moves import is_check
+from moves import (ALL_CASTLING, BLACK_KINGSIDE, BLACK_QUEENSIDE, CAPTURE, CASTLE, CASTLING_MASKS, DOUBLE_PUSH,
+                   EN_PASSANT, PROMOTION_PIECES, WHITE_KINGSIDE, WHITE_QUEENSIDE, is_attack_diagonal, is_attack_translational,
+                   SQUARE_NAMES, is_check, is_knight_check, is_pawn_check, move_from, move_positions,
+                   move_promotion, move_to)
+from engine.heuristic import PIECE_VALUES, compute_material_score, compute_piece_square_score, piece_square_value
+from engine.zobrist_hashing import ZobristHashing
+
+
+zobrist_hashing = ZobristHashing()
+
+# Plies without a capture or pawn move after which the game is drawn
+FIFTY_MOVE_PLIES = 100
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = {"p": "pawn", "n": "knight", "b": "bishop", "r": "rook", "q": "queen", "k": "king"}
+# Slots of white_pieces / black_pieces a FEN piece is placed in, pieces beyond
+# them take a free pawn slot as if they were promoted
+PIECE_SLOTS = {"pawn": range(0, 8), "rook": (8, 15), "knight": (9, 14), "bishop": (10, 13), "queen": (11,), "king": (12,)}
+# FEN castling symbols with their right and the king and rook squares it needs
+FEN_CASTLING = [
+    ("K", WHITE_KINGSIDE, 4, 7), ("Q", WHITE_QUEENSIDE, 4, 0),
+    ("k", BLACK_KINGSIDE, 60, 63), ("q", BLACK_QUEENSIDE, 60, 56)
+]
 
 
 class ChessGame():
 
+    # Cross-check the incremental zobrist key against a full rehash after every move
+    verify_hash = False
+    # Cross-check the material and piece-square accumulators against a full recount after every move
+    verify_eval = False
+
     def __init__(self):
         self._create_pieces()
         self._create_board()
         self.total_moves = 0
+        # Plies since the last capture or pawn move
+        self.halfmove_clock = 0
+        # Castling rights (see moves.CASTLING_MASKS) and the square a pawn that has just moved
+        # two squares passed over
+        self.castling = ALL_CASTLING
+        self.ep_square = None
+        # (castling, ep_square, halfmove_clock, captured piece) before every move made,
+        # handle_move pushes and unmake_move pops
+        self.state_stack = []
+        self._create_hash()
+        self._create_eval()
     
     def _create_pieces(self):
         self.wking = wking = ChessPiece("king", "K", "W", [7, 4], None)
@@ -66,87 +105,417 @@ class ChessGame():
             [self.white_pieces[i] for i in range(8, 16)]
         ]
     
+    def _create_hash(self):
+        self.zobrist_key = zobrist_hashing.hash(self)
+        self.ep_hash = zobrist_hashing.hash_ep_square(self)
+        self.castling_hash = zobrist_hashing.hash_castling(self)
+        self.pawn_key = zobrist_hashing.hash_pawns(self)
+        # Zobrist key of every position of the game so far, the current one last
+        self.key_history = [self.zobrist_key]
+
+    def _create_eval(self):
+        self.material = {color: compute_material_score(self, color) for color in ("W", "B")}
+        self.piece_square = {color: compute_piece_square_score(self, color) for color in ("W", "B")}
+
+    def check_eval(self):
+        for color in ("W", "B"):
+            assert self.material[color] == compute_material_score(self, color), "material accumulator out of sync"
+            assert self.piece_square[color] == compute_piece_square_score(self, color), "piece-square accumulator out of sync"
+
+    def update_eval(self, mover, captured, from_pos, to_pos, info):
+        """
+            Applies the move to the material and piece-square accumulators, called by handle_move
+            once the board is updated. captured is the piece taken off info['captured_pos'] or None.
+        """
+        info['eval'] = (self.material["W"], self.material["B"], self.piece_square["W"], self.piece_square["B"])
+
+        color = mover.color
+        if info['is_promotion']:
+            self.piece_square[color] -= piece_square_value("pawn", color, from_pos)
+            self.material[color] += PIECE_VALUES[mover.name] - PIECE_VALUES["pawn"]
+        else:
+            self.piece_square[color] -= piece_square_value(mover.name, color, from_pos)
+        self.piece_square[color] += piece_square_value(mover.name, color, to_pos)
+
+        if captured is not None:
+            self.material[captured.color] -= PIECE_VALUES[captured.name]
+            self.piece_square[captured.color] -= piece_square_value(captured.name, captured.color, info['captured_pos'])
+
+        if info['is_castle']:
+            self.piece_square[color] -= piece_square_value("rook", color, info['init_rook_pos'])
+            self.piece_square[color] += piece_square_value("rook", color, info['final_rook_pos'])
+
+        if self.verify_eval:
+            self.check_eval()
+
+    def update_hash(self, mover, captured, from_pos, to_pos, info):
+        """
+            XORs the move into zobrist_key, called by handle_move once the board and the
+            castling rights are updated. captured is the piece taken off info['captured_pos'] or None.
+        """
+        info['zobrist'] = (self.zobrist_key, self.ep_hash, self.castling_hash)
+        info['pawn_key'] = self.pawn_key
+
+        key = self.zobrist_key ^ self.ep_hash ^ zobrist_hashing.hash_side()
+
+        if mover.symbol == 'P' or info['is_promotion']:
+            self.pawn_key ^= zobrist_hashing.hash_piece('P', mover.color, from_pos)
+            if not info['is_promotion']:
+                self.pawn_key ^= zobrist_hashing.hash_piece('P', mover.color, to_pos)
+        if captured is not None and captured.symbol == 'P':
+            self.pawn_key ^= zobrist_hashing.hash_piece('P', captured.color, info['captured_pos'])
+
+        if info['is_promotion']:
+            key ^= zobrist_hashing.hash_piece('P', mover.color, from_pos)
+        else:
+            key ^= zobrist_hashing.hash_piece(mover.symbol, mover.color, from_pos)
+        key ^= zobrist_hashing.hash_piece(mover.symbol, mover.color, to_pos)
+
+        if captured is not None:
+            key ^= zobrist_hashing.hash_piece(captured.symbol, captured.color, info['captured_pos'])
+
+        if info['is_castle']:
+            key ^= zobrist_hashing.hash_piece('R', mover.color, info['init_rook_pos'])
+            key ^= zobrist_hashing.hash_piece('R', mover.color, info['final_rook_pos'])
+
+        if self.castling != self.state_stack[-1][0]:
+            castling_hash = zobrist_hashing.hash_castling(self)
+            key ^= self.castling_hash ^ castling_hash
+            self.castling_hash = castling_hash
+
+        self.ep_hash = 0
+        if mover.name == "pawn" and abs(to_pos[0] - from_pos[0]) == 2:
+            for j in [to_pos[1] - 1, to_pos[1] + 1]:
+                if 0 <= j <= 7:
+                    pc = self.board[to_pos[0]][j]
+                    if pc.symbol == 'P' and pc.color != mover.color:
+                        self.ep_hash = zobrist_hashing.hash_ep_file(to_pos[1])
+        key ^= self.ep_hash
+
+        self.zobrist_key = key
+
+        if self.verify_hash:
+            assert self.zobrist_key == zobrist_hashing.hash(self), "incremental zobrist key out of sync"
+            assert self.pawn_key == zobrist_hashing.hash_pawns(self), "incremental pawn key out of sync"
+
+    def to_compact(self):
+        """
+            The position as a small tuple of builtins, cheap to pickle and send to another
+            process (see from_compact). Pieces keep their place in white_pieces and black_pieces.
+        """
+        pieces = tuple((piece.name, piece.pos[0], piece.pos[1], piece.is_alive())
+                       for piece in self.white_pieces + self.black_pieces)
+        return pieces, self.castling, self.ep_square, self.total_moves, self.halfmove_clock, tuple(self.key_history)
+
+    def copy(self):
+        """
+            An independent game in the same position. Unlike deepcopy only the pieces are
+            cloned, and the board, keys, accumulators and state stack are rebuilt around the
+            clones without rehashing or rescoring anything.
+        """
+        game = object.__new__(type(self))
+        game.__dict__.update(self.__dict__)
+
+        game.wking = self.wking.clone(None)
+        game.bking = self.bking.clone(None)
+        clones = {self.wking: game.wking, self.bking: game.bking, self.empty_piece: self.empty_piece}
+        for piece in self.white_pieces:
+            if piece is not self.wking:
+                clones[piece] = piece.clone(game.wking)
+        for piece in self.black_pieces:
+            if piece is not self.bking:
+                clones[piece] = piece.clone(game.bking)
+
+        game.white_pieces = [clones[piece] for piece in self.white_pieces]
+        game.black_pieces = [clones[piece] for piece in self.black_pieces]
+        game.board = [[clones[piece] for piece in row] for row in self.board]
+        game.state_stack = [(castling, ep_square, halfmove_clock, None if captured is None else clones[captured])
+                            for (castling, ep_square, halfmove_clock, captured) in self.state_stack]
+        game.key_history = list(self.key_history)
+        game.material = dict(self.material)
+        game.piece_square = dict(self.piece_square)
+        return game
+
+    @classmethod
+    def from_compact(cls, compact):
+        game = cls()
+        game._restore_compact(compact)
+        return game
+
+    def _restore_compact(self, compact):
+        pieces, castling, ep_square, total_moves, halfmove_clock, key_history = compact
+        self.total_moves = total_moves
+        self.halfmove_clock = halfmove_clock
+        self.castling = castling
+        self.ep_square = ep_square
+        self.state_stack = []
+
+        self.board = [[self.empty_piece for _ in range(8)] for _ in range(8)]
+        for piece, (name, i, j, alive) in zip(self.white_pieces + self.black_pieces, pieces):
+            if name != piece.name:
+                piece.promote(name)
+            piece.pos = [i, j]
+            if alive:
+                self.board[i][j] = piece
+            else:
+                piece.captured()
+
+        self._create_hash()
+        self._create_eval()
+        if key_history:
+            self.key_history = list(key_history)
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+            A game set up directly in the position of a FEN record. The pieces are placed into
+            the fixed slots of white_pieces and black_pieces, castling rights whose king or rook
+            is not on its square are dropped.
+        """
+        fields = fen.split()
+        if len(fields) == 4:
+            fields += ["0", "1"]
+        if len(fields) != 6 or len(fields[0].split("/")) != 8:
+            raise ValueError("Invalid FEN " + fen)
+        placement, side, castling, ep, halfmove, fullmove = fields
+        if side not in ("w", "b"):
+            raise ValueError("Invalid FEN " + fen)
+        if castling != "-" and (len(set(castling)) != len(castling) or not set(castling) <= set("KQkq")):
+            raise ValueError("Invalid FEN " + fen)
+        # The en passant square lies behind a pawn of the side that has just moved
+        if ep != "-" and (ep not in SQUARE_NAMES or ep[1] != ("6" if side == "w" else "3")):
+            raise ValueError("Invalid FEN " + fen)
+
+        game = cls()
+        slots = {"W": [None for _ in range(16)], "B": [None for _ in range(16)]}
+
+        for i, row in enumerate(placement.split("/")):
+            j = 0
+            for char in row:
+                if char in "12345678":
+                    j += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or j > 7:
+                    raise ValueError("Invalid FEN " + fen)
+                color = "W" if char.isupper() else "B"
+                name = FEN_PIECES[char.lower()]
+                free = [slot for slot in PIECE_SLOTS[name] if slots[color][slot] is None]
+                if not free:
+                    free = [slot for slot in PIECE_SLOTS["pawn"] if slots[color][slot] is None]
+                if not free or (name == "pawn" and i in (0, 7)):
+                    raise ValueError("Invalid FEN " + fen)
+
+                slots[color][free[0]] = (name, i, j, True)
+                j += 1
+            if j != 8:
+                raise ValueError("Invalid FEN " + fen)
+
+        if slots["W"][12] is None or slots["B"][12] is None:
+            raise ValueError("Invalid FEN " + fen)
+
+        pieces = []
+        for color, default_pieces in (("W", game.white_pieces), ("B", game.black_pieces)):
+            for slot, piece in enumerate(default_pieces):
+                if slots[color][slot] is None:
+                    pieces.append((piece.name, piece.pos[0], piece.pos[1], False))
+                else:
+                    pieces.append(slots[color][slot])
+
+        occupants = {pos_to_square([i, j]): name for (name, i, j, alive) in pieces if alive}
+        castling_rights = 0
+        for symbol, right, king_square, rook_square in FEN_CASTLING:
+            if symbol in castling and occupants.get(king_square) == "king" and occupants.get(rook_square) == "rook":
+                castling_rights |= right
+
+        if ep == "-":
+            ep_square = None
+        else:
+            ep_square = SQUARE_NAMES.index(ep)
+
+        total_moves = 2 * (int(fullmove) - 1) + (1 if side == "b" else 0)
+        game._restore_compact((tuple(pieces), castling_rights, ep_square, total_moves, int(halfmove), ()))
+        return game
+
+    def to_fen(self):
+        rows = []
+        for row in self.board:
+            fen_row = ""
+            empty = 0
+            for pc in row:
+                if pc.symbol == 'E':
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += pc.symbol if pc.color == "W" else pc.symbol.lower()
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+
+        castling = ""
+        for symbol, right, _, _ in FEN_CASTLING:
+            if self.castling & right:
+                castling += symbol
+
+        if self.ep_square is None:
+            ep = "-"
+        else:
+            ep = SQUARE_NAMES[self.ep_square]
+
+        side = self.side_to_move().lower()
+        return " ".join([
+            "/".join(rows), side, castling or "-", ep, str(self.halfmove_clock), str(self.total_moves // 2 + 1)
+        ])
+
+    def side_to_move(self):
+        if self.total_moves % 2 == 0:
+            return "W"
+        else:
+            return "B"
+
     def get_state(self):
         state = {
             'board': self.board,
-            'total_moves': self.total_moves
+            'total_moves': self.total_moves,
+            'castling': self.castling,
+            'ep_square': self.ep_square
         }
         return state
 
-    def generate_all_possible_moves(self, color):
-        all_moves = [None for _ in range(16)]
+    def generate_all_possible_moves(self, color, legal=True):
+        """
+            All moves of color as packed ints (see moves.encode_move).
+            With legal=False the moves are pseudo-legal, see ChessPiece.get_possible_moves
+        """
         if color == "W":
-            for idx, white_piece in enumerate(self.white_pieces):
-                possible_moves, possible_moves_mask, is_capture = white_piece.get_possible_moves(self.get_state())
-                all_moves[idx] = {
-                    'name': white_piece.name,
-                    'possible_moves': possible_moves,
-                    'possible_moves_mask': possible_moves_mask,
-                    'is_capture': is_capture
-                }
+            pieces = self.white_pieces
         else:
-            for idx, black_piece in enumerate(self.black_pieces):
-                possible_moves, possible_moves_mask, is_capture = black_piece.get_possible_moves(self.get_state())
-                all_moves[idx] = {
-                    'name': black_piece.name,
-                    'possible_moves': possible_moves,
-                    'possible_moves_mask': possible_moves_mask,
-                    'is_capture': is_capture
-                }
+            pieces = self.black_pieces
+
+        state = self.get_state()
+        all_moves = []
+        for piece in pieces:
+            all_moves += piece.get_possible_moves(state, legal)
         return all_moves
-    
-    def handle_capture(self, from_pos, to_pos, move_index, info):
+
+    def get_piece_moves(self, piece, legal=True):
+        return piece.get_possible_moves(self.get_state(), legal)
+
+    def is_pseudo_legal_move(self, move, color):
         """
-            Specifically to handle cases like en passant
+            Whether move can be made by color in this position, used to vet moves from the
+            transposition table without generating every move
         """
-        attacker = self.board[from_pos[0]][from_pos[1]]
-        attacker_color = attacker.color
+        from_pos, _ = move_positions(move)
+        pc = self.board[from_pos[0]][from_pos[1]]
+        if pc.color != color:
+            return False
+        return move in self.get_piece_moves(pc, legal=False)
 
-        if attacker.name != "pawn":
-            victim = self.board[to_pos[0]][to_pos[1]]
-            victim.captured()
+    def get_check_info(self, color):
+        """
+            Number of pieces giving check to color's king and the squares of the pieces pinned
+            to it, each mapped to the squares it may still move to. Computed once per node for is_legal.
+        """
+        if color == "W":
+            king_pos = self.wking.pos
         else:
-            if move_index == 4:
-                victim = self.board[from_pos[0]][from_pos[1] - 1]
-                victim.captured()
-                
-                info['is_enpassant'] = True
-                info['enpassant_pos'] = [from_pos[0], from_pos[1] - 1]
-                info['enpassant_pc'] = victim
+            king_pos = self.bking.pos
+
+        checkers = 0
+        pinned = {}
+
+        for rays, is_attacker in ((STRAIGHT_RAYS[king_pos[0]][king_pos[1]], is_attack_translational),
+                                  (DIAGONAL_RAYS[king_pos[0]][king_pos[1]], is_attack_diagonal)):
+            for ray in rays:
+                blocker = None
+                for k, (i, j, square) in enumerate(ray):
+                    pc = self.board[i][j]
+                    if pc.symbol == 'E':
+                        continue
+                    if pc.color == color:
+                        if blocker is not None:
+                            break
+                        blocker = square
+                        continue
+                    if is_attacker(pc.symbol):
+                        if blocker is None:
+                            checkers += 1
+                        else:
+                            pinned[blocker] = set(target for (_, _, target) in ray[:k + 1])
+                    break
 
-                self.board[from_pos[0]][from_pos[1] - 1] = self.create_empty_piece()
-                
-            if move_index == 5:
-                victim = self.board[from_pos[0]][from_pos[1] + 1]
-                victim.captured()
-        
-                info['is_enpassant'] = True
-                info['enpassant_pos'] = [from_pos[0], from_pos[1] + 1]
-                info['enpassant_pc'] = victim
+        if is_knight_check(self.board, color, king_pos):
+            checkers += 1
+        if is_pawn_check(self.board, color, king_pos):
+            checkers += 1
 
-                self.board[from_pos[0]][from_pos[1] + 1] = self.create_empty_piece()
-            else:
-                victim = self.board[to_pos[0]][to_pos[1]]
-                victim.captured()
+        return {
+            'checkers': checkers,
+            'pinned': pinned
+        }
+
+    def is_legal(self, move, check_info):
+        """
+            Legality test for a pseudo-legal move, check_info comes from get_check_info.
+            Only king moves, en passant and moves made while in check need a full king safety test.
+        """
+        from_pos, to_pos = move_positions(move)
+        pc = self.board[from_pos[0]][from_pos[1]]
+        delta = [to_pos[0] - from_pos[0], to_pos[1] - from_pos[1]]
+
+        if pc.name == "king":
+            # Castling squares were already tested while generating
+            if move & CASTLE:
+                return True
+            return pc.is_king_safe(delta, self.board)
+
+        if move & EN_PASSANT:
+            return pc.is_king_safe(delta, self.board, [from_pos[0], to_pos[1]])
+
+        if check_info['checkers']:
+            return pc.is_king_safe(delta, self.board)
+
+        pin = check_info['pinned'].get(move_from(move))
+        return pin is None or move_to(move) in pin
+    
+    def handle_capture(self, from_pos, to_pos, move, info):
+        """
+            Takes the captured piece off the board and returns it, an en passant victim
+            does not stand on to_pos. Its square is kept in info['captured_pos'].
+        """
+        if move & EN_PASSANT:
+            captured_pos = [from_pos[0], to_pos[1]]
+            info['is_enpassant'] = True
+        else:
+            captured_pos = to_pos
+
+        captured = self.board[captured_pos[0]][captured_pos[1]]
+        captured.captured()
+        info['captured_pos'] = captured_pos
+        self.board[captured_pos[0]][captured_pos[1]] = self.empty_piece
+        return captured
             
-    def is_move_valid(self, from_pos, to_pos):
+    def is_move_valid(self, from_pos, to_pos, promotion=4):
+        """
+            Returns whether the move is legal and its packed int, promotion picks the
+            piece a pawn reaching the last rank turns into (see moves.PROMOTION_PIECES)
+        """
         pc = self.board[from_pos[0]][from_pos[1]]
-        possible_moves, possible_moves_mask, is_capture = pc.get_possible_moves(self.get_state())
-        candidate_move = [to_pos[0] - from_pos[0], to_pos[1] - from_pos[1]]
-        for idx in range(len(possible_moves)):
-            if possible_moves[idx] == candidate_move and possible_moves_mask[idx]:
-                move_info = {
-                    'possible_moves': possible_moves,
-                    'possible_moves_mask': possible_moves_mask,
-                    'is_capture': is_capture,
-                    'move_id': idx
-                }
-                return True, move_info
+        to_sq = pos_to_square(to_pos)
+        for move in pc.get_possible_moves(self.get_state()):
+            if move_to(move) == to_sq and move_promotion(move) in (0, promotion):
+                return True, move
         return False, None
     
-    def handle_move(self, from_pos, to_pos, move_info):
-        is_capture = move_info['is_capture']
-        move_id = move_info['move_id']
+    def handle_move(self, move):
+        """
+            Makes a packed int move, the returned info is what unmake_move needs to take it back
+        """
+        from_pos, to_pos = move_positions(move)
+
+        mover = self.board[from_pos[0]][from_pos[1]]
 
         info = {
             'is_enpassant': False,
@@ -154,55 +523,114 @@ class ChessGame():
             'is_promotion': False
         }
 
-        if is_capture[move_id]:
-            self.handle_capture(from_pos, to_pos, move_id, info)
+        captured = None
+        if move & CAPTURE:
+            captured = self.handle_capture(from_pos, to_pos, move, info)
+
+        self.state_stack.append((self.castling, self.ep_square, self.halfmove_clock, captured))
+
+        if move & CAPTURE or mover.name == "pawn":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+
+        self.castling &= CASTLING_MASKS[move_from(move)] & CASTLING_MASKS[move_to(move)]
+        if move & DOUBLE_PUSH:
+            self.ep_square = (move_from(move) + move_to(move)) // 2
+        else:
+            self.ep_square = None
         
         # Promotion
-        if self.board[from_pos[0]][from_pos[1]].name == "pawn" and (to_pos[0] == 0 or to_pos[0] == 7):
-            self.board[from_pos[0]][from_pos[1]].promote()
+        if move_promotion(move):
+            mover.promote(PROMOTION_PIECES[move_promotion(move)])
             info['is_promotion'] = True
         
         # Castling
-        if (self.board[from_pos[0]][from_pos[1]].name == "king"):
-            if self.board[from_pos[0]][from_pos[1]].color == "W":
-                switch_idx = 7
+        if move & CASTLE:
+            switch_idx = from_pos[0]
+
+            if to_pos[1] == 6:
+                init_rook_pos = [switch_idx, 7]
+                final_rook_pos = [switch_idx, 5]
             else:
-                switch_idx = 0
-
-            if move_id == 8:
-                info['is_castle'] = True
-                info['init_rook_pos'] = [switch_idx, 7]
-                info['final_rook_pos'] = [switch_idx, 5]
-                self.board[switch_idx][7].update_pos(switch_idx, 5)
-                self.board[switch_idx][7].update_history([switch_idx, 5], self.total_moves + 1)
-                self.board[switch_idx][5] = self.board[switch_idx][7]
-                self.board[switch_idx][7] = self.create_empty_piece()
-            elif move_id == 9:
-                info['is_castle'] = True
-                info['init_rook_pos'] = [switch_idx, 0]
-                info['final_rook_pos'] = [switch_idx, 3]
-                self.board[switch_idx][0].update_pos(switch_idx, 3)
-                self.board[switch_idx][0].update_history([switch_idx, 3], self.total_moves + 1)
-                self.board[switch_idx][3] = self.board[switch_idx][0]
-                self.board[switch_idx][0] = self.create_empty_piece()
+                init_rook_pos = [switch_idx, 0]
+                final_rook_pos = [switch_idx, 3]
+
+            info['is_castle'] = True
+            info['init_rook_pos'] = init_rook_pos
+            info['final_rook_pos'] = final_rook_pos
+            rook = self.board[init_rook_pos[0]][init_rook_pos[1]]
+            rook.update_pos(final_rook_pos[0], final_rook_pos[1])
+            self.board[final_rook_pos[0]][final_rook_pos[1]] = rook
+            self.board[init_rook_pos[0]][init_rook_pos[1]] = self.empty_piece
                 
-        self.board[from_pos[0]][from_pos[1]].update_pos(to_pos[0], to_pos[1])
-        self.board[from_pos[0]][from_pos[1]].update_history(to_pos, self.total_moves + 1)
+        mover.update_pos(to_pos[0], to_pos[1])
         
-        self.board[to_pos[0]][to_pos[1]] = self.board[from_pos[0]][from_pos[1]]
-        self.board[from_pos[0]][from_pos[1]] = self.create_empty_piece()
+        self.board[to_pos[0]][to_pos[1]] = mover
+        self.board[from_pos[0]][from_pos[1]] = self.empty_piece
 
         self.total_moves += 1
 
+        self.update_hash(mover, captured, from_pos, to_pos, info)
+        self.update_eval(mover, captured, from_pos, to_pos, info)
+        self.key_history.append(self.zobrist_key)
+
+        return info
+
+    def make_null_move(self):
+        """
+            Passes the turn, used by null move pruning. Takes away any en passant right
+            and, by resetting the halfmove clock, repetitions across the pass.
+        """
+        info = {'zobrist': (self.zobrist_key, self.ep_hash, self.castling_hash)}
+        self.state_stack.append((self.castling, self.ep_square, self.halfmove_clock, None))
+        self.zobrist_key ^= self.ep_hash ^ zobrist_hashing.hash_side()
+        self.ep_hash = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.total_moves += 1
+        self.key_history.append(self.zobrist_key)
         return info
 
+    def unmake_null_move(self, info):
+        self.total_moves -= 1
+        self.zobrist_key, self.ep_hash, self.castling_hash = info['zobrist']
+        self.castling, self.ep_square, self.halfmove_clock, _ = self.state_stack.pop()
+        self.key_history.pop()
+
+    def is_in_check(self, color):
+        if color == "W":
+            return is_check(self.board, color, self.wking.pos)
+        else:
+            return is_check(self.board, color, self.bking.pos)
+
+    def repetitions(self):
+        """
+            Number of earlier occurrences of the current position. Only positions with the
+            same side to move since the last capture or pawn move can repeat it.
+        """
+        key = self.zobrist_key
+        earliest = len(self.key_history) - 1 - self.halfmove_clock
+        count = 0
+        for ply in range(len(self.key_history) - 3, max(earliest, 0) - 1, -2):
+            if self.key_history[ply] == key:
+                count += 1
+        return count
+
+    def is_draw(self):
+        """
+            Fifty-move rule or threefold repetition, stalemate is left to the move generation
+        """
+        return self.halfmove_clock >= FIFTY_MOVE_PLIES or self.repetitions() >= 2
+
     def is_checkmate(self):
+        state = self.get_state()
+
         if is_check(self.board, "W", self.white_pieces[12].pos):
             white_checkmated = True
 
             for white_piece in self.white_pieces:
-                possible_moves, possible_moves_mask, is_capture = white_piece.get_possible_moves(self.get_state())
-                if True in possible_moves_mask:
+                if white_piece.get_possible_moves(state):
                     white_checkmated = False
                     break
                     
@@ -213,8 +641,7 @@ class ChessGame():
             black_checkmated = True
 
             for black_piece in self.black_pieces:
-                possible_moves, possible_moves_mask, is_capture = black_piece.get_possible_moves(self.get_state())
-                if True in possible_moves_mask:
+                if black_piece.get_possible_moves(state):
                     black_checkmated = False
                     break
         
@@ -223,40 +650,40 @@ class ChessGame():
 
         return False, None
 
-    def unmake_move(self, from_pos, to_pos, to_pos_pc, info):
-        from_pos_pc = self.board[to_pos[0]][to_pos[1]]
+    def unmake_move(self, move, info):
+        from_pos, to_pos = move_positions(move)
+        mover = self.board[to_pos[0]][to_pos[1]]
+        self.castling, self.ep_square, self.halfmove_clock, captured = self.state_stack.pop()
 
-        if info['is_enpassant']:
-            enpassant_pc = info['enpassant_pc']
-            enpassant_pos = info['enpassant_pos']
-            enpassant_pc.revive()
-            enpassant_pc.update_pos(enpassant_pos[0], enpassant_pos[1])
-            self.board[enpassant_pos[0]][enpassant_pos[1]] = enpassant_pc
-        elif info['is_castle']:
+        if info['is_castle']:
             init_rook_pos = info['init_rook_pos']
             final_rook_pos = info['final_rook_pos']
             rook_pc = self.board[final_rook_pos[0]][final_rook_pos[1]]
             rook_pc.update_pos(init_rook_pos[0], init_rook_pos[1])
-            if len(rook_pc.history) > 1:
-                rook_pc.history.pop()
             self.board[init_rook_pos[0]][init_rook_pos[1]] = rook_pc
-            self.board[final_rook_pos[0]][final_rook_pos[1]] = self.create_empty_piece()
+            self.board[final_rook_pos[0]][final_rook_pos[1]] = self.empty_piece
         elif info['is_promotion']:
-            from_pos_pc.unpromote()
-        
-        if to_pos_pc.symbol != 'E':
-            to_pos_pc.revive()
-            to_pos_pc.update_pos(to_pos[0], to_pos[1])
-            self.board[to_pos[0]][to_pos[1]] = to_pos_pc
-        else:
-            self.board[to_pos[0]][to_pos[1]] = self.create_empty_piece()
-        
-        from_pos_pc.update_pos(from_pos[0], from_pos[1])
-        if len(from_pos_pc.history) > 1:
-            from_pos_pc.history.pop()
-        self.board[from_pos[0]][from_pos[1]] = from_pos_pc
+            mover.unpromote()
+
+        mover.update_pos(from_pos[0], from_pos[1])
+        self.board[from_pos[0]][from_pos[1]] = mover
+        self.board[to_pos[0]][to_pos[1]] = self.empty_piece
+
+        if captured is not None:
+            captured_pos = info['captured_pos']
+            captured.revive()
+            captured.update_pos(captured_pos[0], captured_pos[1])
+            self.board[captured_pos[0]][captured_pos[1]] = captured
 
         self.total_moves -= 1
+        self.key_history.pop()
+
+        self.zobrist_key, self.ep_hash, self.castling_hash = info['zobrist']
+        self.pawn_key = info['pawn_key']
+        self.material["W"], self.material["B"], self.piece_square["W"], self.piece_square["B"] = info['eval']
+
+        if self.verify_eval:
+            self.check_eval()
     
     def input_to_move(self, usr_inp):
         from_pos = usr_inp[0]
@@ -279,7 +706,12 @@ class ChessGame():
         else:
             usr_inp = input("Black turn to move: ")
 
-        usr_inp = [usr_inp[0:2], usr_inp[3:]]
+        # An optional trailing n/b/r/q picks the promotion piece, e.g. "e7 e8n"
+        promotion = 4
+        if len(usr_inp) > 5:
+            promotion = "nbrq".find(usr_inp[5].lower()) + 1
+
+        usr_inp = [usr_inp[0:2], usr_inp[3:5]]
         from_pos, to_pos = self.input_to_move(usr_inp)
 
         if self.total_moves % 2 == 0:
@@ -289,11 +721,11 @@ class ChessGame():
             if self.board[from_pos[0]][from_pos[1]].color != 'B':
                 return False
 
-        valid_move, move_info = self.is_move_valid(from_pos, to_pos)
+        valid_move, move = self.is_move_valid(from_pos, to_pos, promotion)
         if not valid_move:
             return False
 
-        self.handle_move(from_pos, to_pos, move_info)
+        self.handle_move(move)
 
         return True
     
@@ -1,186 +1,481 @@
 import numpy as np
-from copy import deepcopy
-
-from engine.heuristic import eval_position, piece_value
-from engine.transposition import Transposition
-from engine.zobrist_hashing import ZobristHashing
+import time
+
+from engine.heuristic import PIECE_VALUES, capture_gain, eval_position, has_pieces, pawn_hash_table, piece_value
+from engine.transposition import EXACT, LOWER, UPPER, Transposition
+from moves import CAPTURE, EN_PASSANT, move_positions, move_promotion, static_exchange
+
+
+# Depth limit when searching on a time budget
+MAX_TIMED_DEPTH = 64
+# Nodes between two deadline checks, minus one
+TIME_CHECK_MASK = 63
+# Clock based budgets assume this many moves are left and keep this many seconds in reserve
+MOVES_TO_GO = 30
+CLOCK_RESERVE = 0.05
+# Index of a side in the history table
+COLOR_INDEX = {"W": 0, "B": 1}
+# Extra depth taken off the null move search
+NULL_MOVE_REDUCTION = 2
+# Late move reductions start after this many moves, on nodes with at least this much depth left
+LMR_FULL_MOVES = 3
+LMR_MIN_DEPTH = 3
+# Piece worth used by the static exchange evaluation
+SEE_VALUES = {name: piece_value(name) for name in ("pawn", "knight", "bishop", "rook", "queen", "king")}
+# Quiescence skips captures that leave the side this many pawns short of alpha even after winning the victim
+DELTA_MARGIN = 2
+
+
+class SearchTimeout(Exception):
+    """
+        Raised inside the search once the deadline has passed or the search was told to stop
+    """
+    pass
 
 
 class AlphaBetaSearch():
 
-    def __init__(self, max_search_depth, max_quiescence_depth, aspiration_window):
+    def __init__(self, max_search_depth, max_quiescence_depth, aspiration_window, hash_size=16,
+                 null_move_pruning=True, late_move_reductions=True, transposition=None):
+        """
+            hash_size is the size of the transposition table in megabytes, a table passed as
+            transposition (e.g. a SharedTransposition) is used instead of creating one
+        """
         self.max_search_depth = max_search_depth
         self.quiescence_depth = max_quiescence_depth
         self.aspiration_window = aspiration_window
         self.win_utility = 1000000
+        self.draw_utility = 0
         self.color = "B"
-        self.zobrist_hashing = ZobristHashing()
-        self.transposition = Transposition(100000)
+        if transposition is None:
+            transposition = Transposition(hash_size)
+        self.transposition = transposition
+        self.null_move_pruning = null_move_pruning
+        self.late_move_reductions = late_move_reductions
         
         self.cutoffs = 0
         self.quies = 0
+        # Losing captures skipped in quiescence, each one a quiescence node saved
+        self.see_pruned = 0
+        # Captures skipped in quiescence by delta pruning
+        self.delta_pruned = 0
         self.trans_hits = 0
+        self.trans_probes = 0
+        # Transposition table cutoffs by bound type and aspiration window re-searches
+        self.bound_hits = {'exact': 0, 'lower': 0, 'upper': 0}
+        self.researches = 0
+        # Null window probes of principal variation search that had to be searched again
+        self.pvs_researches = 0
+        self.null_cutoffs = 0
+        self.lmr_reductions = 0
+        self.lmr_researches = 0
+
+        # Two killer slots per ply and a butterfly history table indexed by the from and to
+        # bits of a move (move & 0xfff), both fed by quiet moves that cause a cutoff
+        self.killers = [[None, None] for _ in range(max(max_search_depth, MAX_TIMED_DEPTH) + 1)]
+        self.history = np.zeros((2, 64 * 64), dtype=np.int64)
+        self.killer_tries = 0
+        self.killer_hits = 0
+        self.history_tries = 0
+        self.history_hits = 0
+
+        self.nodes = 0
+        self.deadline = None
+        # Set by a controlling process to stop the search like the deadline does
+        self.stop_event = None
+        # Print the statistics of every iteration
+        self.verbose = True
+        # Depth and root value of the last iteration alpha_beta_search completed
+        self.completed_depth = 0
+        self.best_value = None
+        # Statistics of every iteration of the last search, see iteration_statistics
+        self.iterations = []
 
         #self.cutoffs_history = []
         #self.quies_history = []
         #self.trans_hits_history = []
 
+    def evaluate(self, game, color):
+        """
+            eval_position from the view of color, the side to move
+        """
+        evaluation = eval_position(game, self.color)
+        if color == self.color:
+            return evaluation
+        else:
+            return -evaluation
+
     def is_terminal(self, state, alpha, beta):
+        """
+            Utilities are from the view of the side to move.
+            Checkmate and stalemate are found by negamax once it has no legal move to search,
+            a side in check at the horizon goes to quiescence where its evasions are searched.
+        """
         depth = state['depth']
         game = state['game']
         is_capture = state['is_capture']
+        color = game.side_to_move()
 
-        is_checkmate, color = game.is_checkmate()
-    
-        if is_checkmate:
-            if self.color != color:
-                return True, self.win_utility
-            else:
-                return True, -self.win_utility
+        if depth > 0 and game.is_draw():
+            return True, self.draw_utility
 
-        if depth == self.search_depth:
-            if is_capture and depth >= 1:
+        if state['remaining'] <= 0:
+            if (is_capture and depth >= 1) or game.is_in_check(color):
                 qstate = {
                     'game': game,
                     'depth': 0
                 }
                 return True, self.quiescence_search(qstate, alpha, beta)
             else:
-                return True, eval_position(game, self.color)
+                return True, self.evaluate(game, color)
 
         return False, None
 
-    def alpha_beta_search(self, game):
+    def get_time_budget(self, movetime=None, clock=None, increment=0):
+        """
+            Seconds to spend on this move, None searches to max_search_depth instead
+        """
+        if movetime is not None:
+            return movetime
+        if clock is not None:
+            budget = clock / MOVES_TO_GO + 0.75 * increment
+            return max(0, min(budget, clock - CLOCK_RESERVE))
+        return None
+
+    def check_time(self):
+        self.nodes += 1
+        if self.nodes & TIME_CHECK_MASK == 0:
+            if self.deadline is not None and time.time() >= self.deadline:
+                raise SearchTimeout()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise SearchTimeout()
+
+    def reset_counters(self):
+        self.cutoffs = 0
+        self.quies = 0
+        self.see_pruned = 0
+        self.delta_pruned = 0
+        self.trans_hits = 0
+        self.trans_probes = 0
+        self.bound_hits = {'exact': 0, 'lower': 0, 'upper': 0}
+        self.researches = 0
+        self.pvs_researches = 0
+        self.null_cutoffs = 0
+        self.lmr_reductions = 0
+        self.lmr_researches = 0
+        self.killer_tries = 0
+        self.killer_hits = 0
+        self.history_tries = 0
+        self.history_hits = 0
+        pawn_hash_table.reset_stats()
+
+    def iteration_statistics(self, depth, elapsed, value, move):
+        """
+            Counters of the iteration just completed, nodes and elapsed time are since the start of the search
+        """
+        return {
+            'depth': depth,
+            'time': elapsed,
+            'nodes': self.nodes,
+            'cutoffs': self.cutoffs,
+            'quiescence_nodes': self.quies,
+            'tt_hits': self.trans_hits,
+            'tt_probes': self.trans_probes,
+            'value': value,
+            'best_move': move
+        }
+
+    def age_move_heuristics(self, new_search=False):
+        """
+            Halves the history scores between iterations so the latest iterations weigh most,
+            killers only carry over between iterations of the same search
+        """
+        self.history //= 2
+        if new_search:
+            for killers in self.killers:
+                killers[0] = None
+                killers[1] = None
+
+    def update_move_heuristics(self, move, ply, remaining, color):
+        """
+            Records a quiet move that caused a cutoff
+        """
+        if move & CAPTURE:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[COLOR_INDEX[color], move & 0xfff] += remaining ** 2
+
+    def count_heuristic_try(self, move, ply):
+        """
+            Returns which of the killer / history stages move was ordered by, if any
+        """
+        if move & CAPTURE:
+            return None
+        if move in self.killers[ply]:
+            self.killer_tries += 1
+            return "killer"
+        self.history_tries += 1
+        return "history"
+
+    def count_heuristic_hit(self, kind):
+        if kind == "killer":
+            self.killer_hits += 1
+        elif kind == "history":
+            self.history_hits += 1
+
+    def alpha_beta_search(self, game, movetime=None, clock=None, increment=0):
+        """
+            Iterative deepening up to max_search_depth, or until the time budget runs out when
+            movetime (seconds for this move) or clock and increment (seconds left on our clock
+            and added per move) are given. Depth 1 always completes, an iteration cut short by
+            the deadline is thrown away and the move of the last completed one is returned.
+            The aspiration window is around the value for the side to move at the root.
+        """
         alpha = -np.inf
         beta = np.inf
 
-        for depth in range(1, self.max_search_depth + 1):
+        start = time.time()
+        budget = self.get_time_budget(movetime, clock, increment)
+        if budget is None:
+            max_depth = self.max_search_depth
+        else:
+            max_depth = MAX_TIMED_DEPTH
+
+        self.transposition.new_search()
+        self.age_move_heuristics(new_search=True)
+        self.nodes = 0
+        self.deadline = None
+        self.completed_depth = 0
+        self.best_value = None
+        self.iterations = []
+        best_move = None
+
+        # Every completed iteration unmakes all its moves, so one copy serves them all. It is
+        # discarded if the deadline interrupts an iteration half way through a move.
+        game = game.copy()
+
+        for depth in range(1, max_depth + 1):
             self.search_depth = depth
 
             state = {
-                'game': deepcopy(game),
+                'game': game,
                 'depth': 0,
+                'remaining': depth,
                 'is_capture': False
             }
 
-            value, move = self.max_value(state, alpha, beta)
+            try:
+                value, move = self.negamax(state, alpha, beta)
 
-            if value <= alpha or value >= beta:
-                value, move = self.max_value(state, -np.inf, np.inf)
+                if value <= alpha or value >= beta:
+                    self.researches += 1
+                    value, move = self.negamax(state, -np.inf, np.inf)
+            except SearchTimeout:
+                if self.verbose:
+                    print("Search stopped during depth", depth, "after %.2f seconds" % (time.time() - start))
+                self.reset_counters()
+                break
+
+            best_move = move
+            self.completed_depth = depth
+            self.best_value = value
+            self.iterations.append(self.iteration_statistics(depth, time.time() - start, value, move))
 
             alpha = value - self.aspiration_window
             beta = value + self.aspiration_window
 
-            print("Alpha beta search completed for depth", depth, end=". ")
-            print("Number of cutoffs =", self.cutoffs, end=". ")
-            print("Number of quiescence expansion =", self.quies, end=". ")
-            print("Number of transposition table hits =", self.trans_hits, end=". ")
-            print()
+            if self.verbose:
+                print("Alpha beta search completed for depth", depth, end=". ")
+                print("Total nodes =", self.nodes, end=". ")
+                print("Number of cutoffs =", self.cutoffs, end=". ")
+                print("Number of quiescence expansion = %d (%d saved by SEE, %d by delta pruning)" % (self.quies, self.see_pruned, self.delta_pruned), end=". ")
+                print("Number of transposition table hits =", self.trans_hits, end=". ")
+                print("Bound hits (exact/lower/upper) = %d/%d/%d" % (self.bound_hits['exact'], self.bound_hits['lower'], self.bound_hits['upper']), end=". ")
+                print("Number of re-searches =", self.researches, end=". ")
+                print("Number of PVS re-searches =", self.pvs_researches, end=". ")
+                print("Null move cutoffs =", self.null_cutoffs, end=". ")
+                print("LMR re-searches = %d/%d" % (self.lmr_researches, self.lmr_reductions), end=". ")
+                print("Killer hit rate = %d/%d" % (self.killer_hits, self.killer_tries), end=". ")
+                print("History hit rate = %d/%d" % (self.history_hits, self.history_tries), end=". ")
+                print("Pawn hash hit rate = %d/%d" % (pawn_hash_table.hits, pawn_hash_table.probes), end=". ")
+                print()
 
             #self.cutoffs_history.append(self.cutoffs)
             #self.quies_history.append(self.quies)
             #self.trans_hits_history.append(self.trans_hits)
 
-            self.cutoffs = 0
-            self.quies = 0
-            self.trans_hits = 0
-
-        return move
-
-    def get_move_ordering(self, game, color):
-        moves = []
-        moves_priority = []
-
-        def append_move(move, priority):
-            moves.append(move)
-            moves_priority.append(priority)
-
-        all_moves = game.generate_all_possible_moves(color)
-
+            self.reset_counters()
+            self.age_move_heuristics()
+
+            if budget is not None:
+                # The next iteration takes several times as long, don't start what can't finish
+                if time.time() - start >= budget / 2:
+                    break
+                self.deadline = start + budget
+
+        self.deadline = None
+        return best_move
+
+    def capture_priority(self, game, move):
+        """
+            Material won by the capture, negative for losing captures.
+            Taking a piece worth at least the capturing one can not lose material, so the
+            MVV-LVA difference is used for those and the full static exchange only for the rest.
+        """
+        from_pos, to_pos = move_positions(move)
+        capturing_pc = game.board[from_pos[0]][from_pos[1]].name
+        victim_pc = game.board[to_pos[0]][to_pos[1]].name
+        if victim_pc == "empty":
+            victim_pc = "pawn"
+        priority = piece_value(victim_pc) - piece_value(capturing_pc)
+        if priority >= 0:
+            return priority
+        return static_exchange(game.board, move, SEE_VALUES)
+
+    def get_move_ordering(self, game, color, ply=0, captures_only=False, prune_losing=False):
+        """
+            Staged move picker yielding pseudo-legal moves: the transposition table move,
+            winning and even captures by static exchange, the killer moves of this ply, quiet
+            moves by history score and finally losing captures, unless prune_losing drops them.
+            Moves are only generated and sorted once the stages before them failed to cut off,
+            callers check game.is_legal right before making a move.
+        """
         # Principal variation (PC move) with depth smaller than the depth the algo is about to go to
         trans_move = self.query_transposition_move(game)
         if trans_move != None:
-            append_move(trans_move, 100)
-        
-        for pc_idx, all_move in enumerate(all_moves):
-            possible_moves = all_move['possible_moves']
-            possible_moves_mask = all_move['possible_moves_mask']
-            is_capture = all_move['is_capture']
-
-            for idx in range(len(possible_moves)):
-                if possible_moves_mask[idx]:
-                    if color == "B":
-                        mypiece = game.black_pieces[pc_idx]
-                    else:
-                        mypiece = game.white_pieces[pc_idx]
-                    
-                    possible_move = possible_moves[idx]
-
-                    from_pos = mypiece.pos
-                    to_pos = [mypiece.pos[0] + possible_move[0], mypiece.pos[1] + possible_move[1]]
-
-                    move_info = {
-                        'possible_moves': possible_moves,
-                        'possible_moves_mask': possible_moves_mask,
-                        'is_capture': is_capture,
-                        'move_id': idx,
-                        'piece_id': pc_idx,
-                        'from_pos': from_pos,
-                        'to_pos': to_pos
-                    }
-
-                    if is_capture[idx]:
-                        capturing_pc = mypiece.name
-                        victim_pc = game.board[to_pos[0]][to_pos[1]].name
-                        if victim_pc == "empty":
-                            victim_pc = "pawn"
-                        priority = piece_value(victim_pc) - piece_value(capturing_pc)
-                        priority += 100
-                    else:
-                        priority = 0
-
-                    append_move(move_info, priority)
-        
-        moves_priority = [[priority, idx] for idx, priority in enumerate(moves_priority)]
-        sorted(moves_priority, reverse=True)
-
-        sorted_moves = []
-        for moves_p in moves_priority:
-            sorted_moves.append(moves[moves_p[1]])
-        
-        return sorted_moves
-
-    def max_value(self, state, alpha, beta):
+            if captures_only and not trans_move & CAPTURE:
+                trans_move = None
+            elif game.is_pseudo_legal_move(trans_move, color):
+                yield trans_move
+            else:
+                trans_move = None
+
+        captures = []
+        quiets = []
+        for move in game.generate_all_possible_moves(color, legal=False):
+            if move == trans_move:
+                continue
+            if move & CAPTURE:
+                captures.append((self.capture_priority(game, move), move))
+            elif not captures_only:
+                quiets.append(move)
+
+        captures.sort(reverse=True)
+
+        losing_captures = []
+        for priority, move in captures:
+            if priority < 0:
+                losing_captures.append(move)
+            else:
+                yield move
+
+        if not captures_only:
+            for killer in self.killers[ply]:
+                if killer in quiets:
+                    quiets.remove(killer)
+                    yield killer
+
+            history = self.history[COLOR_INDEX[color]]
+            quiets.sort(key=lambda move: history[move & 0xfff], reverse=True)
+
+        for move in quiets:
+            yield move
+
+        if prune_losing:
+            self.see_pruned += len(losing_captures)
+            return
+
+        for move in losing_captures:
+            yield move
+
+    def negamax(self, state, alpha, beta):
+        """
+            Principal variation search, values are from the view of the side to move.
+            The first legal move is searched with the full window, the others with a null
+            window around alpha and only searched again if they turn out to beat it.
+            state['depth'] is the distance from the root, state['remaining'] the depth left.
+        """
+        self.check_time()
         terminal, utility = self.is_terminal(state, alpha, beta)
 
         game = state['game']
         depth = state['depth']
+        remaining = state['remaining']
 
         if terminal:
             return utility, None
         
-        v, best_move = self.query_transposition(game, depth, self.search_depth)
+        v, best_move = self.query_transposition(game, remaining, alpha, beta)
         if v != None:
             return v, best_move
+
+        alpha_orig = alpha
+        color = game.side_to_move()
+        check_info = game.get_check_info(color)
+
+        # Null move pruning: if passing still fails high the node is not worth searching
+        if (self.null_move_pruning and depth > 0 and remaining > NULL_MOVE_REDUCTION and
+            not state.get('null_move') and not check_info['checkers'] and beta < np.inf and
+            has_pieces(game, color)):
+            info = game.make_null_move()
+            null_state = {
+                'game': game,
+                'depth': depth + 1,
+                'remaining': remaining - 1 - NULL_MOVE_REDUCTION,
+                'is_capture': False,
+                'null_move': True
+            }
+            score = -self.negamax(null_state, -beta, -beta + 1)[0]
+            game.unmake_null_move(info)
+
+            if score >= beta:
+                self.null_cutoffs += 1
+                return score, None
         
         v = -np.inf
         best_move = None
+        searched = 0
 
-        moves = self.get_move_ordering(game, "B")
+        moves = self.get_move_ordering(game, color, depth)
         
         for move in moves:
-            to_pos_pc = game.board[move['to_pos'][0]][move['to_pos'][1]]
-            info = game.handle_move(move['from_pos'], move['to_pos'], move)
+            if not game.is_legal(move, check_info):
+                continue
+
+            heuristic = self.count_heuristic_try(move, depth)
+            info = game.handle_move(move)
 
             new_state = {
                 'game': game,
                 'depth': depth + 1,
-                'is_capture': move['is_capture'][move['move_id']]
+                'remaining': remaining - 1,
+                'is_capture': bool(move & CAPTURE)
             }
 
-            v2, a2 = self.min_value(new_state, alpha, beta)
+            if searched == 0 or alpha == -np.inf:
+                v2 = -self.negamax(new_state, -beta, -alpha)[0]
+            else:
+                # Late move reductions: quiet moves ordered late are searched one ply shallower first
+                if (self.late_move_reductions and searched >= LMR_FULL_MOVES and remaining >= LMR_MIN_DEPTH and
+                    heuristic == "history" and not move_promotion(move) and not check_info['checkers']):
+                    self.lmr_reductions += 1
+                    reduced_state = dict(new_state, remaining=remaining - 2)
+                    v2 = -self.negamax(reduced_state, -alpha - 1, -alpha)[0]
+                    if v2 > alpha:
+                        self.lmr_researches += 1
+                        v2 = -self.negamax(new_state, -alpha - 1, -alpha)[0]
+                else:
+                    v2 = -self.negamax(new_state, -alpha - 1, -alpha)[0]
+
+                if alpha < v2 < beta:
+                    self.pvs_researches += 1
+                    v2 = -self.negamax(new_state, -beta, -alpha)[0]
 
-            game.unmake_move(move['from_pos'], move['to_pos'], to_pos_pc, info)
+            game.unmake_move(move, info)
+            searched += 1
 
             if v2 > v:
                 v, best_move = v2, move
@@ -188,62 +483,40 @@ class AlphaBetaSearch():
             
             if v >= beta:
                 self.cutoffs += 1
-                self.update_transposition(v, best_move, self.search_depth - depth, game)
+                self.count_heuristic_hit(heuristic)
+                self.update_move_heuristics(move, depth, remaining, color)
+                self.update_transposition(v, best_move, remaining, game, LOWER)
                 return v, best_move
 
-        self.update_transposition(v, best_move, self.search_depth - depth, game)
-        return v, best_move
-    
-    def min_value(self, state, alpha, beta):
-        terminal, utility = self.is_terminal(state, alpha, beta)
-
-        game = state['game']
-        depth = state['depth']
-
-        if terminal:
-            return utility, None
-        
-        v, best_move = self.query_transposition(game, depth, self.search_depth)
-        if v != None:
-            return v, best_move
-        
-        v = np.inf
-        best_move = None
-        
-        moves = self.get_move_ordering(game, "W")
-    
-        for move in moves:
-            to_pos_pc = game.board[move['to_pos'][0]][move['to_pos'][1]]
-            info = game.handle_move(move['from_pos'], move['to_pos'], move)
-
-            new_state = {
-                'game': game,
-                'depth': depth + 1,
-                'is_capture': move['is_capture'][move['move_id']]
-            }
-
-            v2, a2 = self.max_value(new_state, alpha, beta)
-
-            game.unmake_move(move['from_pos'], move['to_pos'], to_pos_pc, info)
+        if searched == 0:
+            # No legal move: checkmate or stalemate
+            if check_info['checkers']:
+                v = -self.win_utility
+            else:
+                v = self.draw_utility
+            self.update_transposition(v, None, remaining, game, EXACT)
+            return v, None
 
-            if v2 < v:
-                v, best_move = v2, move
-                beta = min(beta, v)
-            
-            if v <= alpha:
-                self.cutoffs += 1
-                self.update_transposition(v, best_move, self.search_depth - depth, game)
-                return v, best_move
-        
-        self.update_transposition(v, best_move, self.search_depth - depth, game)
+        self.update_transposition(v, best_move, remaining, game, self.get_bound(v, alpha_orig, beta))
         return v, best_move
     
-    def update_transposition(self, value, move, depth, game):
-        zobrist_key = self.zobrist_hashing.hash(game)
-        self.transposition.add_entry(zobrist_key, depth, value, move)
+    def get_bound(self, value, alpha, beta):
+        """
+            A value outside the window the node was searched with is only a bound on the true value
+        """
+        if value <= alpha:
+            return UPPER
+        if value >= beta:
+            return LOWER
+        return EXACT
+
+    def update_transposition(self, value, move, depth, game, bound=EXACT):
+        zobrist_key = game.zobrist_key
+        self.transposition.add_entry(zobrist_key, depth, value, move, bound)
     
     def query_transposition_move(self, game):
-        zobrist_key = self.zobrist_hashing.hash(game)
+        zobrist_key = game.zobrist_key
+        self.trans_probes += 1
         entry = self.transposition.lookup(zobrist_key)
         if entry == None or entry['key'] != zobrist_key:
             return None
@@ -251,80 +524,108 @@ class AlphaBetaSearch():
             self.trans_hits += 1
             return entry['best_move']
     
-    def query_transposition(self, game, depth, search_depth):
-        zobrist_key = self.zobrist_hashing.hash(game)
+    def query_transposition(self, game, remaining, alpha, beta):
+        """
+            Returns the stored value only if it was searched at least remaining plies deep
+            and decides the node for the (alpha, beta) window
+        """
+        zobrist_key = game.zobrist_key
+        self.trans_probes += 1
         entry = self.transposition.lookup(zobrist_key)
-        if entry != None and entry['key'] == zobrist_key and entry['depth'] >= search_depth - depth:
-            v, a = entry['evaluation'], entry['best_move']
-            self.trans_hits += 1
-            return v, a
+        if entry == None or entry['key'] != zobrist_key or entry['depth'] < remaining:
+            return None, None
+
+        v, a = entry['evaluation'], entry['best_move']
+        if entry['bound'] == EXACT:
+            self.bound_hits['exact'] += 1
+        elif entry['bound'] == LOWER and v >= beta:
+            self.bound_hits['lower'] += 1
+        elif entry['bound'] == UPPER and v <= alpha:
+            self.bound_hits['upper'] += 1
         else:
             return None, None
+
+        self.trans_hits += 1
+        return v, a
     
+    def delta_prunable(self, game, move, stand_pat, alpha):
+        """
+            True when even the evaluation swing of winning the victim (see capture_gain) plus
+            DELTA_MARGIN pawns can not lift stand_pat to alpha, promotions are never pruned
+        """
+        if move_promotion(move):
+            return False
+        from_pos, to_pos = move_positions(move)
+        if move & EN_PASSANT:
+            victim = game.board[from_pos[0]][to_pos[1]]
+        else:
+            victim = game.board[to_pos[0]][to_pos[1]]
+        return stand_pat + capture_gain(game, victim) + PIECE_VALUES["pawn"] * DELTA_MARGIN <= alpha
+
     def quiescence_search(self, qstate, alpha, beta):
+        """
+            Captures only, values are from the view of the side to move.
+            A side in check may not stand pat and searches all of its evasions instead,
+            having none is checkmate.
+        """
         game = qstate['game']
         depth = qstate['depth']
         self.quies += 1
+        self.check_time()
 
-        if game.total_moves % 2 == 0:
-            color = "W"
-        else:
-            color = "B"
+        color = game.side_to_move()
 
-        is_checkmate, check_color = game.is_checkmate()
-        if is_checkmate:
-            if self.color != color:
-                return self.win_utility
-            else:
-                return -self.win_utility
-
-        v, best_move = self.query_transposition(game, depth, self.quiescence_depth)
+        v, best_move = self.query_transposition(game, self.quiescence_depth - depth, alpha, beta)
         if v != None:
-            return v, best_move
+            return v
 
-        stand_pat = eval_position(game, self.color)
+        check_info = game.get_check_info(color)
+        in_check = bool(check_info['checkers'])
+
+        if in_check:
+            moves = self.get_move_ordering(game, color)
+        else:
+            stand_pat = self.evaluate(game, color)
 
-        if color == "B":
             if stand_pat >= beta:
                 return beta
             if stand_pat > alpha:
                 alpha = stand_pat
-        else:
-            if stand_pat <= alpha:
-                return alpha
-            if stand_pat < beta:
-                beta = stand_pat
 
-        if depth >= self.quiescence_depth:
-            return stand_pat
-        
-        for move in self.get_move_ordering(game, color):
-            if move['is_capture'][move['move_id']]:
-                to_pos_pc = game.board[move['to_pos'][0]][move['to_pos'][1]]
+            if depth >= self.quiescence_depth:
+                return stand_pat
+
+            moves = self.get_move_ordering(game, color, captures_only=True, prune_losing=True)
 
-                info = game.handle_move(move['from_pos'], move['to_pos'], move)
+        legal_moves = 0
+        for move in moves:
+            if game.is_legal(move, check_info):
+                legal_moves += 1
+                if not in_check and self.delta_prunable(game, move, stand_pat, alpha):
+                    self.delta_pruned += 1
+                    continue
+
+                if in_check and depth >= self.quiescence_depth:
+                    # Not mated, the evasions are not searched past the quiescence limit
+                    return self.evaluate(game, color)
+
+                info = game.handle_move(move)
                 
                 qstate = {
                     'game': game,
                     'depth': depth + 1
                 }
 
-                score = self.quiescence_search(qstate, alpha, beta)
+                score = -self.quiescence_search(qstate, -beta, -alpha)
 
-                game.unmake_move(move['from_pos'], move['to_pos'], to_pos_pc, info)
+                game.unmake_move(move, info)
 
-                if color == "B":
-                    if score >= beta:
-                        return beta
-                    if score > alpha:
-                        alpha = score
-                else:
-                    if score <= alpha:
-                        return alpha
-                    if score < beta:
-                        beta = score
+                if score >= beta:
+                    return beta
+                if score > alpha:
+                    alpha = score
+
+        if in_check and legal_moves == 0:
+            return -self.win_utility
         
-        if color == "B":
-            return alpha
-        else:
-            return beta
+        return alpha
@@ -1,16 +1,38 @@
 import numpy as np
 
 from engine.alphabeta import AlphaBetaSearch
+from engine.lazy_smp import LazySMPSearch
 from engine.opening_book import open_reader
+from engine.root_split import RootSplitSearch
+from moves import move_to_polyglot
 
 
 class Engine():
 
-    def __init__(self):
-        self.minimax = AlphaBetaSearch(4, 5, 1000)
+    def __init__(self, hash_size=16, workers=1, parallel="lazy_smp"):
+        """
+            hash_size is the transposition table size in megabytes. With more than one worker the
+            search runs in that many processes, parallel picks how they split the work:
+            "lazy_smp" shares one table between them (see LazySMPSearch), "root_split" gives
+            each a share of the root moves and a table of its own (see RootSplitSearch).
+            Both have the alpha_beta_search, completed_depth, best_value and verbose of
+            AlphaBetaSearch, so get_move uses whichever search was picked the same way.
+        """
+        if workers > 1 and parallel == "lazy_smp":
+            self.minimax = LazySMPSearch(4, 5, 1000, workers, hash_size)
+        elif workers > 1 and parallel == "root_split":
+            self.minimax = RootSplitSearch(4, 5, 1000, workers, hash_size)
+        elif workers > 1:
+            raise ValueError("Unknown parallel search " + str(parallel))
+        else:
+            self.minimax = AlphaBetaSearch(4, 5, 1000, hash_size)
         self.opening_book = open_reader("./engine/performance.bin")
     
-    def get_move(self, game):
+    def get_move(self, game, movetime=None, clock=None, increment=0):
+        """
+            Returns the engine's move for black as a packed int, see moves.encode_move
+            Without movetime or clock the search runs to a fixed depth, see AlphaBetaSearch.alpha_beta_search
+        """
         # Use opening book if possible
         use_opening_book = True
         try:
@@ -19,16 +41,16 @@ class Engine():
             use_opening_book = False
         
         if use_opening_book:
-            entry = entry.move_name
-            from_pos = [8 - int(entry[1]), ord(entry[0]) - ord('a')]
-            to_pos = [8 - int(entry[3]), ord(entry[2]) - ord('a')]
-            return from_pos, to_pos
+            for move in game.generate_all_possible_moves("B"):
+                if move_to_polyglot(move) == entry.raw_move:
+                    return move
         
         # Finally, resort to alpha beta search
-        move = self.minimax.alpha_beta_search(game)
-        pc_idx = move['piece_id']
-        possible_move = move['possible_moves'][move['move_id']]
-        from_pos = game.black_pieces[pc_idx].pos
-        to_pos = [from_pos[0] + possible_move[0], from_pos[1] + possible_move[1]]
-        
-        return from_pos, to_pos
+        return self.minimax.alpha_beta_search(game, movetime, clock, increment)
+
+    def close(self):
+        """
+            Releases the worker processes and shared memory of a parallel search
+        """
+        if hasattr(self.minimax, "close"):
+            self.minimax.close()
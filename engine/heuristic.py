@@ -1,6 +1,27 @@
 import numpy as np
 
 
+PIECE_VALUES = {"pawn": 100, "knight": 350, "bishop": 350, "rook": 525, "queen": 1000, "king": 10000}
+
+# Piece-square tables from white's view, indexed like the board (i * 8 + j, rank 8 first).
+# The values are already weighted, the pawn table is the advanced pawn bonus of pawn_structure.
+PIECE_SQUARE_TABLES = {
+    "pawn": [1.0 for _ in range(32)] + [0.0 for _ in range(32)],
+    "knight": [0.0 for _ in range(64)],
+    "bishop": [0.0 for _ in range(64)],
+    "rook": [0.0 for _ in range(64)],
+    "queen": [0.0 for _ in range(64)],
+    "king": [0.0 for _ in range(64)]
+}
+
+
+def piece_square_value(name, color, pos):
+    if color == "W":
+        return PIECE_SQUARE_TABLES[name][pos[0] * 8 + pos[1]]
+    else:
+        return PIECE_SQUARE_TABLES[name][(7 - pos[0]) * 8 + pos[1]]
+
+
 def has_bishop_pair(game, color):
     if color == "W":
         pieces = game.white_pieces
@@ -59,6 +80,23 @@ def has_pawns(game, color):
     return False
 
 
+def has_pieces(game, color):
+    """
+        Whether color has anything besides pawns and the king, without it null moves
+        are unsafe since zugzwang is common
+    """
+    if color == "W":
+        pieces = game.white_pieces
+    else:
+        pieces = game.black_pieces
+
+    for piece in pieces:
+        if piece.is_alive() and piece.name != "pawn" and piece.name != "king":
+            return True
+
+    return False
+
+
 def compute_material_score(game, color):
     if color == "W":
         pieces = game.white_pieces
@@ -69,81 +107,133 @@ def compute_material_score(game, color):
 
     for piece in pieces:
         if piece.is_alive():
-            if piece.name == "pawn":
-                material_score += 100
-            elif piece.name == "knight":
-                material_score += 350
-            elif piece.name == "bishop":
-                material_score += 350
-            elif piece.name == "rook":
-                material_score += 525
-            elif piece.name == "queen":
-                material_score += 1000
-            else:
-                material_score += 10000
+            material_score += PIECE_VALUES[piece.name]
     
     return material_score
 
 
-def pawn_structure(game, color):
+def compute_piece_square_score(game, color):
+    if color == "W":
+        pieces = game.white_pieces
+    else:
+        pieces = game.black_pieces
+
+    piece_square_score = 0
+
+    for piece in pieces:
+        if piece.is_alive():
+            piece_square_score += piece_square_value(piece.name, color, piece.pos)
+
+    return piece_square_score
+
+
+def pawn_structure_details(game, color):
+    """
+        Full scan of color's pawns, returns [score, isolated, doubled, passed].
+        Passed pawns are counted for reference but not scored.
+    """
     board = game.board
     pawn_score = 0
+    isolated = 0
+    doubled = 0
+    passed = 0
 
     if color == "W":
         pawns = game.white_pieces[0:8]
-        # Past pawn
-        for pawn in pawns:
-            if pawn.pos[0] <= 3:
-                pawn_score += 10
-        # Isolated pawn and doubled pawn check
-        surrounds = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1]]
-        for pawn in pawns:
-            is_isolated = True
-            is_doubled = False
-            for surround in surrounds:
-                i = pawn.pos[0] + surround[0]
-                j = pawn.pos[1] + surround[1]
-                if i < 0 or i > 7 or j < 0 or j > 7:
-                    continue
-                if board[i][j].name == "pawn" and board[i][j].color == color:
-                    is_isolated = False
-                if i == 0 and board[i][j].name == "pawn" and board[i][j].color == color:
-                    is_doubled = True
-
-            if is_isolated:
-                pawn_score -= 10
-            
-            if is_doubled:
-                pawn_score -= 10
-    
-    if color == "B":
+        enemy_pawns = game.black_pieces[0:8]
+        forward = -1
+    else:
         pawns = game.black_pieces[0:8]
-        # Past pawn
-        for pawn in pawns:
-            if pawn.pos[0] >= 4:
-                pawn_score += 10
-        # Isolated pawn and doubled pawn check
-        surrounds = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1]]
-        for pawn in pawns:
-            is_isolated = True
-            is_doubled = False
-            for surround in surrounds:
-                i = pawn.pos[0] + surround[0]
-                j = pawn.pos[1] + surround[1]
-                if i < 0 or i > 7 or j < 0 or j > 7:
-                    continue
-                if board[i][j].name == "pawn" and board[i][j].color == color:
-                    is_isolated = False
-                if i == 0 and board[i][j].name == "pawn" and board[i][j].color == color:
-                    is_doubled = True
-
-            if is_isolated:
-                pawn_score -= 10
-            
-            if is_doubled:
-                pawn_score -= 10
-
-    return pawn_score
+        enemy_pawns = game.white_pieces[0:8]
+        forward = 1
+
+    enemy_pawns = [pawn.pos for pawn in enemy_pawns if pawn.is_alive() and pawn.name == "pawn"]
+
+    # Advanced pawns are scored by the pawn piece-square table
+    # Isolated pawn and doubled pawn check
+    surrounds = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1]]
+    for pawn in pawns:
+        if not pawn.is_alive() or pawn.name != "pawn":
+            continue
+        is_isolated = True
+        is_doubled = False
+        for surround in surrounds:
+            i = pawn.pos[0] + surround[0]
+            j = pawn.pos[1] + surround[1]
+            if i < 0 or i > 7 or j < 0 or j > 7:
+                continue
+            if board[i][j].name == "pawn" and board[i][j].color == color:
+                is_isolated = False
+            if i == 0 and board[i][j].name == "pawn" and board[i][j].color == color:
+                is_doubled = True
+
+        if is_isolated:
+            pawn_score -= 10
+            isolated += 1
+        
+        if is_doubled:
+            pawn_score -= 10
+            doubled += 1
+
+        is_passed = True
+        for pos in enemy_pawns:
+            if abs(pos[1] - pawn.pos[1]) <= 1 and (pos[0] - pawn.pos[0]) * forward > 0:
+                is_passed = False
+                break
+        if is_passed:
+            passed += 1
+
+    return [pawn_score, isolated, doubled, passed]
+
+
+class PawnHashTable():
+    """
+        Bounded, direct-mapped cache of pawn_structure_details for both colors keyed by
+        ChessGame.pawn_key. An empty slot reads as the pawnless structure (key 0), whose
+        details are all zero anyway.
+    """
+
+    def __init__(self, size=16384):
+        self.size = size
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.details = np.zeros((size, 2, 4), dtype=np.int32)
+        self.hits = 0
+        self.probes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.probes = 0
+
+    def hit_rate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def probe(self, game):
+        """
+            Pawn structure details of white and black, computed and stored on a miss
+        """
+        key = game.pawn_key
+        idx = key % self.size
+        self.probes += 1
+        if self.keys[idx] == key:
+            self.hits += 1
+            return self.details[idx].tolist()
+
+        details = [pawn_structure_details(game, "W"), pawn_structure_details(game, "B")]
+        self.keys[idx] = key
+        self.details[idx] = details
+        return details
+
+
+pawn_hash_table = PawnHashTable()
+
+
+def pawn_structure(game, color):
+    if color == "W":
+        return pawn_hash_table.probe(game)[0][0]
+    else:
+        return pawn_hash_table.probe(game)[1][0]
 
 
 def queen_nonlinearity(game, color):
@@ -157,8 +247,36 @@ def queen_nonlinearity(game, color):
         return 0
 
 
-def eval_color_position(game, color):
-    material_score = compute_material_score(game, color)
+def capture_gain(game, victim):
+    """
+        Most that taking victim can raise the capturer's side of eval_position, leaving out the
+        piece-square and pawn structure changes: its material, the queen term when it is the
+        queen queen_nonlinearity counts, and the pair and last pawn terms it may switch
+    """
+    if victim.color == "W":
+        queen = game.white_pieces[11]
+    else:
+        queen = game.black_pieces[11]
+
+    gain = PIECE_VALUES[victim.name] + 0.7 * 20
+    if victim is queen:
+        gain += 1.0 * 1000
+    if victim.name == "pawn":
+        gain += 0.1 * 50
+    return gain
+
+
+def eval_color_position(game, color, incremental=True):
+    """
+        incremental reads the material and piece-square accumulators ChessGame keeps up to
+        date in handle_move and the pawn hash table, otherwise all are recomputed from the pieces
+    """
+    if incremental:
+        material_score = game.material[color]
+        piece_square_score = game.piece_square[color]
+    else:
+        material_score = compute_material_score(game, color)
+        piece_square_score = compute_piece_square_score(game, color)
 
     if has_bishop_pair(game, color):
         bishop_pair = 20
@@ -180,23 +298,121 @@ def eval_color_position(game, color):
     else:
         pawns_alive = -50
     
-    pawn_structure_score = pawn_structure(game, color)
+    if incremental:
+        pawn_structure_score = pawn_structure(game, color)
+    else:
+        pawn_structure_score = pawn_structure_details(game, color)[0]
 
     queen_score = queen_nonlinearity(game, color)
 
-    eval_score = material_score + 0.7 * (bishop_pair + rook_pair + knight_pair) + 0.1 * (pawns_alive + pawn_structure_score) + 1.0 * queen_score
+    eval_score = material_score + piece_square_score + 0.7 * (bishop_pair + rook_pair + knight_pair) + 0.1 * (pawns_alive + pawn_structure_score) + 1.0 * queen_score
 
     return eval_score
 
 
-def eval_position(game, color):
+def eval_position(game, color, incremental=True):
     """
         Engine is always black
     """
-    evaluation = eval_color_position(game, "B") - eval_color_position(game, "W")
+    evaluation = eval_color_position(game, "B", incremental) - eval_color_position(game, "W", incremental)
     return evaluation
 
 
+# Batch evaluation. A position is either (12, 64) planes ordered white pawn, knight, bishop,
+# rook, queen, king then the same for black, or (64,) piece codes: 0 for an empty square,
+# 1 to 6 for a white pawn ... king and -1 to -6 for black. Squares run a1 = 0 ... h8 = 63.
+BATCH_PIECES = ["pawn", "knight", "bishop", "rook", "queen", "king"]
+BATCH_CODES = np.array([1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6], dtype=np.int8)
+
+
+def _batch_tables():
+    """
+        Material plus piece-square value of every plane and square, black positive
+    """
+    tables = np.zeros((12, 64), dtype=np.float64)
+    for square in range(64):
+        pos = [7 - (square >> 3), square & 7]
+        for idx, name in enumerate(BATCH_PIECES):
+            tables[idx, square] = -(PIECE_VALUES[name] + piece_square_value(name, "W", pos))
+            tables[6 + idx, square] = PIECE_VALUES[name] + piece_square_value(name, "B", pos)
+    return tables
+
+
+BATCH_TABLES = _batch_tables()
+
+
+def encode_position(game):
+    """
+        (64,) int8 piece codes of a game, see eval_batch
+    """
+    codes = np.zeros(64, dtype=np.int8)
+    for color, pieces in (("W", game.white_pieces), ("B", game.black_pieces)):
+        sign = 1 if color == "W" else -1
+        for piece in pieces:
+            if piece.is_alive():
+                codes[(7 - piece.pos[0]) * 8 + piece.pos[1]] = sign * (BATCH_PIECES.index(piece.name) + 1)
+    return codes
+
+
+def _neighbours(grid):
+    """
+        Squares next to any set square of (N, 8, 8) boolean grids, in all eight directions
+    """
+    padded = np.pad(grid, ((0, 0), (1, 1), (1, 1)))
+    near = np.zeros_like(grid)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if di or dj:
+                near |= padded[:, 1 + di:9 + di, 1 + dj:9 + dj]
+    return near
+
+
+def _batch_pawn_structure(pawns):
+    """
+        pawn_structure of (N, 8, 8) pawn grids (rank 1 first): isolated pawns have no friendly
+        pawn around them, doubled ones have one on rank 8 next to them, each costs 10
+    """
+    isolated = pawns & ~_neighbours(pawns)
+    last_rank = np.zeros_like(pawns)
+    last_rank[:, 7, :] = pawns[:, 7, :]
+    doubled = pawns & _neighbours(last_rank)
+    return -10 * (isolated.sum(axis=(1, 2)) + doubled.sum(axis=(1, 2)))
+
+
+def eval_batch(positions, chunk_size=65536):
+    """
+        eval_position for every position of an (N, 12, 64) or (N, 64) int8 array in vectorized
+        passes of chunk_size positions. Pair and queen terms count pieces, so unlike eval_position
+        they also count promoted pieces.
+    """
+    positions = np.asarray(positions)
+    scores = np.zeros(len(positions), dtype=np.float64)
+
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        if chunk.ndim == 2:
+            planes = chunk[:, None, :] == BATCH_CODES[None, :, None]
+        else:
+            planes = chunk != 0
+        n = len(planes)
+
+        counts = planes.sum(axis=2)
+        material = planes.reshape(n, 12 * 64) @ BATCH_TABLES.reshape(12 * 64)
+
+        score = material
+        for side, sign in ((0, -1), (6, 1)):
+            pairs = 20 * (counts[:, side + 2] >= 2) - 20 * (counts[:, side + 3] >= 2) - 20 * (counts[:, side + 1] >= 2)
+            pawns_alive = -50 * (counts[:, side] == 0)
+            pawns = planes[:, side].reshape(n, 8, 8)
+            pawn_score = _batch_pawn_structure(pawns)
+            queen = 1000 * (counts[:, side + 4] >= 1)
+            score = score + sign * (0.7 * pairs + 0.1 * (pawns_alive + pawn_score) + 1.0 * queen)
+
+        scores[start:start + n] = score
+
+    return scores
+
+
 def piece_value(piece_name):
     if piece_name == "pawn":
         return 1
@@ -0,0 +1,145 @@
+import multiprocessing
+import numpy as np
+import queue
+import time
+
+from engine.alphabeta import AlphaBetaSearch
+from engine.transposition import SharedTransposition
+
+
+# Seconds the parent waits for a report before it checks whether the workers are still alive
+REPORT_POLL = 0.1
+
+
+def lazy_smp_worker(worker_id, game, search_params, table_params, stop_event, results, movetime, clock, increment,
+                    verbose):
+    """
+        Runs one search of the Lazy SMP pool and puts (worker_id, completed depth, root value,
+        move, nodes, error) on results, error is None unless the search raised. Odd workers search one ply deeper and every helper starts from
+        a different random history table, so that they spread out over the tree instead of
+        repeating worker 0's search; what they find reaches the others through the shared table.
+        With verbose worker 0 prints its iteration statistics.
+    """
+    max_search_depth, max_quiescence_depth, aspiration_window = search_params
+    hash_size, name, generation = table_params
+
+    transposition = SharedTransposition(hash_size, name=name)
+    transposition.generation = generation
+
+    try:
+        search = AlphaBetaSearch(max_search_depth + worker_id % 2, max_quiescence_depth, aspiration_window,
+                                 transposition=transposition)
+        search.stop_event = stop_event
+        search.verbose = verbose and worker_id == 0
+        if worker_id > 0:
+            rng = np.random.default_rng(worker_id)
+            search.history[:] = rng.integers(0, 64, size=search.history.shape)
+
+        move = search.alpha_beta_search(game, movetime, clock, increment)
+        results.put((worker_id, search.completed_depth, search.best_value, move, search.nodes, None))
+        search.transposition = None
+    except Exception as error:
+        results.put((worker_id, 0, None, None, 0, repr(error)))
+    finally:
+        transposition.close()
+
+
+class LazySMPSearch():
+    """
+        Multi-process search: workers processes search the same root at the same time and only
+        share their transposition table, which lives in shared memory. Once worker 0 completes
+        its search the helpers are stopped and the move of the deepest completed iteration is played.
+        A worker that fails or dies counts as having found nothing. If worker 0 fails the helpers
+        are stopped as well and the move comes from them, if none has one RuntimeError is raised.
+    """
+
+    def __init__(self, max_search_depth, max_quiescence_depth, aspiration_window, workers=2, hash_size=16):
+        """
+            hash_size is the size of the shared transposition table in megabytes
+        """
+        self.search_params = (max_search_depth, max_quiescence_depth, aspiration_window)
+        self.workers = workers
+        self.hash_size = hash_size
+        self.transposition = SharedTransposition(hash_size)
+        self.context = multiprocessing.get_context()
+
+        # Worker and depth the last move came from
+        self.completed_depth = 0
+        self.best_value = None
+        self.best_worker = None
+        # Print the statistics of worker 0's iterations and of the whole search
+        self.verbose = True
+
+    def alpha_beta_search(self, game, movetime=None, clock=None, increment=0):
+        start = time.time()
+        stop_event = self.context.Event()
+        results = self.context.Queue()
+        table_params = (self.hash_size, self.transposition.name, self.transposition.generation)
+
+        processes = []
+        for worker_id in range(self.workers):
+            process = self.context.Process(target=lazy_smp_worker,
+                                           args=(worker_id, game, self.search_params, table_params,
+                                                 stop_event, results, movetime, clock, increment, self.verbose))
+            process.start()
+            processes.append(process)
+
+        reports = {}
+        # Workers found dead without a report, given one more poll for a report still in the pipe
+        exited = set()
+        while len(reports) < len(processes):
+            try:
+                report = results.get(timeout=REPORT_POLL)
+            except queue.Empty:
+                for worker_id, process in enumerate(processes):
+                    if worker_id in reports or process.exitcode is None:
+                        continue
+                    if worker_id in exited:
+                        reports[worker_id] = (worker_id, 0, None, None, 0, "exit code %d" % process.exitcode)
+                        if worker_id == 0:
+                            stop_event.set()
+                    else:
+                        exited.add(worker_id)
+                continue
+
+            reports[report[0]] = report
+            if report[0] == 0:
+                stop_event.set()
+
+        for process in processes:
+            process.join()
+
+        # The workers moved their table generation on, keep ours in step
+        self.transposition.new_search()
+
+        failed = [report for report in reports.values() if report[5] is not None]
+        if self.verbose:
+            for report in failed:
+                print("Lazy SMP worker %d failed: %s" % (report[0], report[5]))
+
+        completed = [report for report in reports.values() if report[3] is not None]
+        if not completed:
+            if reports[0][5] is not None:
+                raise RuntimeError("Lazy SMP search failed, worker 0: " + reports[0][5])
+            # No legal move at the root, worker 0 searched it like the single-process search
+            completed = [reports[0]]
+        worker_id, depth, value, move, _, _ = max(completed, key=lambda report: (report[1], -report[0]))
+        self.completed_depth = depth
+        self.best_value = value
+        self.best_worker = worker_id
+
+        if self.verbose:
+            nodes = sum(report[4] for report in reports.values())
+            elapsed = time.time() - start
+            print("Lazy SMP search with %d workers completed depth %d (worker %d)" % (self.workers, depth, worker_id), end=". ")
+            print("Total nodes =", nodes, end=". ")
+            print("Nodes per second = %d" % (nodes / max(elapsed, 1e-9)))
+
+        return move
+
+    def close(self):
+        """
+            Frees the shared transposition table
+        """
+        self.transposition.close()
+        self.transposition.unlink()
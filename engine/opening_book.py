@@ -11,8 +11,6 @@ import mmap
 from types import TracebackType
 from typing import Callable, Container, Iterator, List, NamedTuple, Optional, Type, Union
 
-from engine.zobrist_hashing import ZobristHashing
-
 
 PathLike = Union[str, bytes, os.PathLike]
 ENTRY_STRUCT = struct.Struct(">QHHI")
@@ -60,7 +58,6 @@ class MemoryMappedReader:
 
     def __init__(self, filename: PathLike) -> None:
         self.fd = os.open(filename, os.O_RDONLY | os.O_BINARY if hasattr(os, "O_BINARY") else os.O_RDONLY)
-        self.zobrist = ZobristHashing()
 
         try:
             self.mmap: Union[mmap.mmap, _EmptyMmap] = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
@@ -138,7 +135,7 @@ class MemoryMappedReader:
 
     def find_all(self, game, *, minimum_weight: int = 1) -> Iterator[Entry]:
         """Seeks a specific position and yields corresponding entries."""
-        key = self.zobrist.hash(game)
+        key = game.zobrist_key
 
         i = self.bisect_key_left(key)
         size = len(self)
@@ -0,0 +1,204 @@
+import numpy as np
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine.alphabeta import MAX_TIMED_DEPTH, AlphaBetaSearch, SearchTimeout
+from moves import CAPTURE
+
+
+# Search of the worker process, created once by the pool initializer so that its
+# transposition table and move ordering tables carry over between tasks
+_worker_search = None
+# Id of the root search the worker's tables were last reset for
+_worker_search_id = None
+
+
+def init_root_split_worker(max_quiescence_depth, aspiration_window, hash_size):
+    global _worker_search
+    _worker_search = AlphaBetaSearch(MAX_TIMED_DEPTH, max_quiescence_depth, aspiration_window, hash_size)
+    _worker_search.verbose = False
+
+
+def search_root_moves(game_class, compact, moves, depth, alpha, beta, deadline, search_id):
+    """
+        Searches the given root moves to depth in the worker's own process and returns
+        ([(move, value), ...], nodes, CPU seconds spent). alpha rises as the moves are searched,
+        moves left when the deadline passes are returned with value None and those after
+        a move that fails high are not returned at all. The pool may hand a process its first
+        task of a search at any depth, so the reset for a new root goes by search_id.
+    """
+    global _worker_search_id
+    search = _worker_search
+    start = time.process_time()
+    if search_id != _worker_search_id:
+        _worker_search_id = search_id
+        search.transposition.new_search()
+        search.age_move_heuristics(new_search=True)
+    search.nodes = 0
+    search.deadline = deadline
+
+    game = game_class.from_compact(compact)
+    values = []
+    for move in moves:
+        info = game.handle_move(move)
+        state = {
+            'game': game,
+            'depth': 1,
+            'remaining': depth - 1,
+            'is_capture': bool(move & CAPTURE)
+        }
+        try:
+            value = -search.negamax(state, -beta, -alpha)[0]
+        except SearchTimeout:
+            values += [(move, None) for move in moves[len(values):]]
+            break
+        game.unmake_move(move, info)
+
+        values.append((move, value))
+        if value >= beta:
+            # Fails high, the root is searched again with a full window
+            break
+        alpha = max(alpha, value)
+
+    search.deadline = None
+    search.age_move_heuristics()
+    return values, search.nodes, time.process_time() - start
+
+
+class RootSplitSearch():
+    """
+        Parallel search for batch analysis: each iteration deals the root moves, in the order
+        of get_move_ordering, out to a process pool. Every worker searches its share with its own
+        transposition table from a compact copy of the position (see ChessGame.to_compact),
+        the root alpha of the last iteration is sent to all of them with the next one.
+    """
+
+    def __init__(self, max_search_depth, max_quiescence_depth, aspiration_window, workers=2, hash_size=16):
+        """
+            hash_size is the size of each worker's transposition table in megabytes
+        """
+        self.max_search_depth = max_search_depth
+        self.aspiration_window = aspiration_window
+        self.workers = workers
+        # Only orders the root moves, the workers do the searching
+        self.search = AlphaBetaSearch(max_search_depth, max_quiescence_depth, aspiration_window, hash_size=1)
+        self.pool = ProcessPoolExecutor(workers, initializer=init_root_split_worker,
+                                        initargs=(max_quiescence_depth, aspiration_window, hash_size))
+
+        self.completed_depth = 0
+        self.best_value = None
+        # Print the statistics of every iteration
+        self.verbose = True
+        # Counts the calls of alpha_beta_search, see search_root_moves
+        self.search_id = 0
+        # Per completed depth: (depth, seconds, seconds since the search started, nodes, CPU utilization)
+        self.scaling = []
+
+    def root_moves(self, game, color):
+        check_info = game.get_check_info(color)
+        return [move for move in self.search.get_move_ordering(game, color) if game.is_legal(move, check_info)]
+
+    def search_depth(self, game, compact, moves, depth, alpha, beta, deadline):
+        """
+            One iteration over all root moves, returns the best (value, move), the nodes searched,
+            the CPU seconds the workers used and whether the deadline cut the iteration short
+        """
+        shares = [moves[worker::self.workers] for worker in range(self.workers)]
+        futures = [self.pool.submit(search_root_moves, type(game), compact, share, depth, alpha, beta, deadline,
+                                    self.search_id)
+                   for share in shares if share]
+
+        best_value, best_move = -np.inf, None
+        nodes, busy, timed_out = 0, 0, False
+        for future in futures:
+            values, worker_nodes, worker_time = future.result()
+            nodes += worker_nodes
+            busy += worker_time
+            for move, value in values:
+                if value is None:
+                    timed_out = True
+                elif value > best_value:
+                    best_value, best_move = value, move
+
+        return best_value, best_move, nodes, busy, timed_out
+
+    def alpha_beta_search(self, game, movetime=None, clock=None, increment=0):
+        """
+            Iterative deepening like AlphaBetaSearch.alpha_beta_search. CPU utilization is the
+            CPU time the workers used over workers times the wall clock time. It stays below
+            100% when the workers wait on each other or share cores, but it is not a speedup,
+            see scaling_efficiency for that.
+        """
+        start = time.time()
+        budget = self.search.get_time_budget(movetime, clock, increment)
+        if budget is None:
+            max_depth = self.max_search_depth
+        else:
+            max_depth = MAX_TIMED_DEPTH
+
+        color = game.side_to_move()
+        compact = game.to_compact()
+        self.search_id += 1
+        self.search.transposition.new_search()
+        self.completed_depth = 0
+        self.best_value = None
+        self.scaling = []
+
+        alpha = -np.inf
+        beta = np.inf
+        deadline = None
+        best_move = None
+
+        for depth in range(1, max_depth + 1):
+            iteration_start = time.time()
+            moves = self.root_moves(game, color)
+            if not moves:
+                break
+
+            value, move, nodes, busy, timed_out = self.search_depth(game, compact, moves, depth, alpha, beta, deadline)
+            if not timed_out and (value <= alpha or value >= beta):
+                value, move, more_nodes, more_busy, timed_out = self.search_depth(game, compact, moves, depth,
+                                                                                  -np.inf, np.inf, deadline)
+                nodes += more_nodes
+                busy += more_busy
+            if timed_out:
+                if self.verbose:
+                    print("Search stopped during depth", depth, "after %.2f seconds" % (time.time() - start))
+                break
+
+            best_move = move
+            self.completed_depth = depth
+            self.best_value = value
+            # The best move is searched first by the next iteration
+            self.search.update_transposition(value, move, depth, game)
+
+            alpha = value - self.aspiration_window
+            beta = value + self.aspiration_window
+
+            elapsed = time.time() - iteration_start
+            utilization = busy / (self.workers * max(elapsed, 1e-9))
+            self.scaling.append((depth, elapsed, time.time() - start, nodes, utilization))
+            if self.verbose:
+                print("Root split search completed for depth", depth, end=". ")
+                print("Total nodes =", nodes, end=". ")
+                print("Time = %.2f seconds" % elapsed, end=". ")
+                print("CPU utilization over %d workers = %.0f%%" % (self.workers, 100 * utilization))
+
+            if budget is not None:
+                if time.time() - start >= budget / 2:
+                    break
+                deadline = start + budget
+
+        return best_move
+
+    def scaling_efficiency(self, serial_times):
+        """
+            Per depth of the last search, the single-process time to depth over workers times
+            ours: 1 for a perfect speedup, 1 / workers for none. serial_times[d - 1] is the
+            time AlphaBetaSearch took to complete depth d on the same root, see bench.py.
+        """
+        return [(depth, serial_times[depth - 1] / (self.workers * max(time_to_depth, 1e-9)))
+                for (depth, _, time_to_depth, _, _) in self.scaling if depth <= len(serial_times)]
+
+    def close(self):
+        self.pool.shutdown()
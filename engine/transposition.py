@@ -1,41 +1,167 @@
 import numpy as np
+import struct
+from multiprocessing import shared_memory
 
-from engine.zobrist_hashing import ZobristHashing
+
+# Bound of a stored evaluation
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+ENTRY_DTYPE = np.dtype([
+    ('key', np.uint64),
+    ('evaluation', np.float64),
+    ('move', np.uint32),
+    ('depth', np.int8),
+    ('bound', np.uint8),
+    ('generation', np.uint8)
+])
+
+# Entries of the table shared between processes. data packs the move (bits 0-31), depth (32-39),
+# bound (40-47) and generation (48-55), check is the key XORed with the other two words.
+SHARED_ENTRY_DTYPE = np.dtype([
+    ('check', np.uint64),
+    ('evaluation', np.float64),
+    ('data', np.uint64)
+])
+
+
+def float_bits(value):
+    return struct.unpack("<Q", struct.pack("<d", value))[0]
 
 
 class Transposition():
+    """
+        Fixed-size table of ENTRY_DTYPE records grouped into buckets of bucket_size slots.
+        A key may live in any slot of its bucket, when the bucket is full the entry with
+        the lowest depth, less two plies for every search it has sat unused, is replaced.
+    """
+
+    def __init__(self, size_mb=16, bucket_size=4):
+        self.bucket_size = bucket_size
+        self.num_buckets = max(1, (size_mb * 1024 * 1024) // (ENTRY_DTYPE.itemsize * bucket_size))
+        self.size = self.num_buckets * bucket_size
+        self.table = np.zeros((self.num_buckets, bucket_size), dtype=ENTRY_DTYPE)
+        self.keys = self.table['key']
+        self.generation = 0
 
-    def __init__(self, size):
-        self.size = size
-        self.hashtable = [None for _ in range(size)]
+    def new_search(self):
+        """
+            Entries written by earlier searches become the first to be replaced
+        """
+        self.generation = (self.generation + 1) & 0xff
+
+    def clear(self):
+        self.table.fill(0)
+        self.generation = 0
 
     def hash_function(self, key):
-        return key % self.size
+        return key % self.num_buckets
+
+    def replacement_score(self, depth, generation):
+        age = (self.generation - generation) & 0xff
+        return depth - 2 * age
 
-    def replace(self, entry1, entry2):
-        # Keep the deepest search
-        if entry1['depth'] > entry2['depth']:
-            return entry1
+    def bucket_keys(self, hash_key):
+        return self.keys[hash_key].tolist()
+
+    def load(self, hash_key, slot):
+        """
+            (key, evaluation, move, depth, bound, generation) of a slot
+        """
+        return self.table[hash_key, slot].item()
+
+    def store(self, hash_key, slot, key, evaluation, move, depth, bound):
+        self.table[hash_key, slot] = (key, evaluation, move, depth, bound, self.generation)
+
+    def add_entry(self, key, depth, evaluation, best_move, bound=EXACT):
+        """
+            best_move is a packed int (see moves.encode_move) or None
+        """
+        hash_key = self.hash_function(key)
+        keys = self.bucket_keys(hash_key)
+
+        if key in keys:
+            slot = keys.index(key)
+            # Keep the deepest search of the position unless it is stale
+            _, _, _, stored_depth, _, stored_generation = self.load(hash_key, slot)
+            if stored_depth > depth and stored_generation == self.generation:
+                return
+        elif 0 in keys:
+            slot = keys.index(0)
         else:
-            return entry2
+            scores = [self.replacement_score(entry[3], entry[5])
+                      for entry in (self.load(hash_key, slot) for slot in range(self.bucket_size))]
+            slot = scores.index(min(scores))
+
+        self.store(hash_key, slot, key, evaluation, 0 if best_move is None else best_move, depth, bound)
 
-    def add_entry(self, key, depth, evaluation, best_move):
-        entry = {
-            'key': key,
+    def lookup(self, key):
+        hash_key = self.hash_function(key)
+        keys = self.bucket_keys(hash_key)
+        if key not in keys:
+            return None
+
+        # The slot is read a second time, another process may have rewritten it in between
+        stored_key, evaluation, move, depth, bound, _ = self.load(hash_key, keys.index(key))
+        if stored_key != key:
+            return None
+
+        return {
+            'key': stored_key,
             'depth': depth,
             'evaluation': evaluation,
-            'best_move': best_move
+            'best_move': move if move else None,
+            'bound': bound
         }
-        hash_key = self.hash_function(key)
 
-        if self.hashtable[hash_key] != None:
-            self.hashtable[hash_key] = self.replace(self.hashtable[hash_key], entry)
-        else:
-            self.hashtable[hash_key] = entry
-    
-    def lookup(self, key):
-        entry = self.hashtable[self.hash_function(key)]
-        if entry != None and entry['key'] == key:
-            return entry
+
+class SharedTransposition(Transposition):
+    """
+        Transposition table in a multiprocessing.shared_memory block that several search
+        processes read and write without locks. Every entry stores its key XORed with its
+        payload, so an entry torn by two processes writing it at once no longer matches
+        its key and reads as empty instead of returning another position's data.
+        Without name a new block is created, other processes attach to it by name.
+    """
+
+    def __init__(self, size_mb=16, bucket_size=4, name=None):
+        self.bucket_size = bucket_size
+        self.num_buckets = max(1, (size_mb * 1024 * 1024) // (SHARED_ENTRY_DTYPE.itemsize * bucket_size))
+        self.size = self.num_buckets * bucket_size
+        nbytes = self.size * SHARED_ENTRY_DTYPE.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
         else:
-            return None
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.table = np.ndarray((self.num_buckets, bucket_size), dtype=SHARED_ENTRY_DTYPE, buffer=self.shm.buf)
+        if name is None:
+            self.table.fill(0)
+        self.generation = 0
+
+    def close(self):
+        """
+            Detaches this process, the creating process also frees the block with unlink
+        """
+        self.table = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def bucket_keys(self, hash_key):
+        bucket = self.table[hash_key]
+        return (bucket['check'] ^ bucket['evaluation'].view(np.uint64) ^ bucket['data']).tolist()
+
+    def load(self, hash_key, slot):
+        check, evaluation, data = self.table[hash_key, slot].item()
+        key = check ^ float_bits(evaluation) ^ data
+        depth = (data >> 32) & 0xff
+        if depth >= 0x80:
+            depth -= 0x100
+        return key, evaluation, data & 0xffffffff, depth, (data >> 40) & 0xff, (data >> 48) & 0xff
+
+    def store(self, hash_key, slot, key, evaluation, move, depth, bound):
+        data = move | ((depth & 0xff) << 32) | (bound << 40) | (self.generation << 48)
+        self.table[hash_key, slot] = (key ^ float_bits(evaluation) ^ data, evaluation, data)
@@ -238,6 +238,12 @@ class ZobristHashing():
             if piece_sym == 'K':
                 return 10
 
+    def hash_piece(self, piece_sym, color, pos):
+        num = self.piece_to_num(piece_sym, color)
+        row = 7 - pos[0]
+        fil = pos[1]
+        return self.zobrist_table[64 * num + 8 * row + fil]
+
     def hash_board(self, game):
         board = game.board
 
@@ -247,27 +253,46 @@ class ZobristHashing():
             for j in range(0, 8):
                 if board[i][j].symbol != 'E':
                     pc = board[i][j]
-                    num = self.piece_to_num(pc.symbol, pc.color)
-                    row = 7 - i
-                    fil = j
-                    h ^= self.zobrist_table[64 * num + 8 * row + fil]
+                    h ^= self.hash_piece(pc.symbol, pc.color, [i, j])
 
         return h
-    
-    def hash_castling(self, game):
+
+    def hash_pawns(self, game):
+        """
+            Pawn-only key for the pawn hash table
+        """
         h = 0
 
-        castlings = game.wking.get_castling_rights(game.get_state())
-        for idx in range(2):
-            if castlings[idx]:
-                h ^= self.zobrist_table[768 + idx]
+        for piece in game.white_pieces + game.black_pieces:
+            if piece.symbol == 'P' and piece.is_alive():
+                h ^= self.hash_piece('P', piece.color, piece.pos)
 
-        castlings = game.bking.get_castling_rights(game.get_state())
-        for idx in range(2):
-            if castlings[idx]:
-                h ^= self.zobrist_table[768 + idx + 2]
-        
         return h
+
+    def hash_castling_rights(self, castlings, color):
+        """
+            castlings is [queenside, kingside] as returned by get_castling_rights
+        """
+        if color == "W":
+            offset = 768
+        else:
+            offset = 770
+
+        h = 0
+        if castlings[1]:
+            h ^= self.zobrist_table[offset]
+        if castlings[0]:
+            h ^= self.zobrist_table[offset + 1]
+
+        return h
+    
+    def hash_castling(self, game):
+        h = self.hash_castling_rights(game.wking.get_castling_rights(game.get_state()), "W")
+        h ^= self.hash_castling_rights(game.bking.get_castling_rights(game.get_state()), "B")
+        return h
+
+    def hash_ep_file(self, fil):
+        return self.zobrist_table[772 + fil]
     
     def hash_ep_square(self, game):
         white_pieces = game.white_pieces
@@ -276,14 +301,14 @@ class ZobristHashing():
         is_ep = [False for _ in range(8)]
 
         for white_piece in white_pieces:
-            if white_piece.name == "pawn":
+            if white_piece.name == "pawn" and white_piece.is_alive():
                 enpassants = white_piece.check_for_enpassant(game.get_state())
                 for ep in enpassants:
                     fil = ep[1] + white_piece.pos[1]
                     is_ep[fil] = True
         
         for black_piece in black_pieces:
-            if black_piece.name == "pawn":
+            if black_piece.name == "pawn" and black_piece.is_alive():
                 enpassants = black_piece.check_for_enpassant(game.get_state())
                 for ep in enpassants:
                     fil = ep[1] + black_piece.pos[1]
@@ -291,15 +316,22 @@ class ZobristHashing():
         
         for idx, ep in enumerate(is_ep):
             if ep:
-                return self.zobrist_table[772 + idx]
+                return self.hash_ep_file(idx)
         
         return 0
+
+    def hash_side(self):
+        return self.zobrist_table[780]
     
     def hash_turn(self, game):
         if game.total_moves % 2 == 0:
-            return self.zobrist_table[780]
+            return self.hash_side()
         else:
             return 0    
     
     def hash(self, game):
+        """
+            Full rehash of the position. ChessGame keeps zobrist_key up to date
+            incrementally, this is only needed to seed or cross-check it.
+        """
         return (self.hash_board(game) ^ self.hash_castling(game) ^ self.hash_ep_square(game) ^ self.hash_turn(game))
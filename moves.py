@@ -1,6 +1,76 @@
 import numpy as np
 
-from utils import generate_diagonal_indexes, generate_translational_indexes
+from attacks import DIAGONAL_RAYS, KING_TARGETS, KNIGHT_TARGETS, PAWN_ATTACKERS, STRAIGHT_RAYS, square_to_pos
+
+
+# Moves are packed into a single int. The low 16 bits follow the Polyglot layout
+# (see opening_book.py): to square in bits 0-5, from square in bits 6-11 and the
+# promotion piece in bits 12-14. The flags above them are only used internally.
+# Castling is stored as the king's two square step, move_to_polyglot converts it.
+PROMOTION_PIECES = [None, "knight", "bishop", "rook", "queen"]
+PIECE_SYMBOLS = {"pawn": "P", "knight": "N", "bishop": "B", "rook": "R", "queen": "Q", "king": "K"}
+SQUARE_NAMES = [f + r for r in "12345678" for f in "abcdefgh"]
+
+CAPTURE = 1 << 16
+EN_PASSANT = 1 << 17
+CASTLE = 1 << 18
+DOUBLE_PUSH = 1 << 19
+
+# Castling rights bitmask and the rights left after a move from or to each square:
+# moving the king or a rook, or capturing a rook on its corner, gives up those rights
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+CASTLING_MASKS = [ALL_CASTLING for _ in range(64)]
+CASTLING_MASKS[4] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[7] &= ~WHITE_KINGSIDE
+CASTLING_MASKS[0] &= ~WHITE_QUEENSIDE
+CASTLING_MASKS[60] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[63] &= ~BLACK_KINGSIDE
+CASTLING_MASKS[56] &= ~BLACK_QUEENSIDE
+
+
+def encode_move(from_sq, to_sq, promotion=0, flags=0):
+    return to_sq | (from_sq << 6) | (promotion << 12) | flags
+
+
+def move_from(move):
+    return (move >> 6) & 0x3f
+
+
+def move_to(move):
+    return move & 0x3f
+
+
+def move_promotion(move):
+    return (move >> 12) & 0x7
+
+
+def move_positions(move):
+    """
+        from_pos and to_pos in board coordinates
+    """
+    return square_to_pos((move >> 6) & 0x3f), square_to_pos(move & 0x3f)
+
+
+def move_name(move):
+    name = SQUARE_NAMES[move_from(move)] + SQUARE_NAMES[move_to(move)]
+    if move_promotion(move):
+        name += PIECE_SYMBOLS[PROMOTION_PIECES[move_promotion(move)]].lower()
+    return name
+
+
+def move_to_polyglot(move):
+    raw_move = move & 0x7fff
+    if move & CASTLE:
+        # Polyglot castles onto the rook's square
+        if move_to(move) > move_from(move):
+            raw_move = (raw_move & ~0x3f) | (move_from(move) + 3)
+        else:
+            raw_move = (raw_move & ~0x3f) | (move_from(move) - 4)
+    return raw_move
 
 
 def is_attack_translational(pc_class):
@@ -12,38 +82,6 @@ def is_attack_translational(pc_class):
         return False
 
 
-def check_horizontal(board, color, king_pos, indexes):
-    for i in indexes:
-        pc = board[i][king_pos[1]]
-        sym = pc.symbol
-        pc_color = pc.color
-        if sym == 'E':
-            continue
-        if pc_color == color:
-            return False
-        if is_attack_translational(sym):
-            return True
-        else:
-            return False
-    return False
-
-
-def check_vertical(board, color, king_pos, indexes):
-    for i in indexes:
-        pc = board[king_pos[0]][i]
-        sym = pc.symbol
-        pc_color = pc.color
-        if sym == 'E':
-            continue
-        if pc_color == color:
-            return False
-        if is_attack_translational(sym):
-            return True
-        else:
-            return False
-    return False
-    
-
 def is_attack_diagonal(pc_class):
     if pc_class == 'Q':
         return True
@@ -53,127 +91,57 @@ def is_attack_diagonal(pc_class):
         return False
 
 
-def check_diagonal(board, color, king_pos, indexes):
-    for (i, j) in indexes:
+def check_ray(board, color, ray, is_attacker):
+    for (i, j, _) in ray:
         pc = board[i][j]
         sym = pc.symbol
-        pc_color = pc.color
         if sym == 'E':
             continue
-        if pc_color == color:
-            return False
-        if is_attack_diagonal(sym):
-            return True
-        else:
+        if pc.color == color:
             return False
+        return is_attacker(sym)
     return False
 
 
 def is_eight_way_check(board, color, king_pos):
-   # First check all translational
-    indexes1, indexes2 = generate_translational_indexes(king_pos[0])
-    hori1 = check_horizontal(board, color, king_pos, indexes1)
-    hori2 = check_horizontal(board, color, king_pos, indexes2)
-    if hori1 | hori2:
-        return True
-    
-    indexes1, indexes2 = generate_translational_indexes(king_pos[1])        
-    verti1 = check_vertical(board, color, king_pos, indexes1)
-    verti2 = check_vertical(board, color, king_pos, indexes2)
-    if verti1 | verti2:
-        return True
-    
+    # First check all translational
+    for ray in STRAIGHT_RAYS[king_pos[0]][king_pos[1]]:
+        if check_ray(board, color, ray, is_attack_translational):
+            return True
+
     # Then check all diagonals
-    indexes1, indexes2, indexes3, indexes4 = generate_diagonal_indexes(king_pos[0], king_pos[1])
-    diag1 = check_diagonal(board, color, king_pos, indexes1)
-    diag2 = check_diagonal(board, color, king_pos, indexes2)
-    diag3 = check_diagonal(board, color, king_pos, indexes3)
-    diag4 = check_diagonal(board, color, king_pos, indexes4)
-    if diag1 | diag2 | diag3 | diag4:
-        return True
+    for ray in DIAGONAL_RAYS[king_pos[0]][king_pos[1]]:
+        if check_ray(board, color, ray, is_attack_diagonal):
+            return True
 
     return False
 
 
 def is_knight_check(board, color, king_pos):
-    i = king_pos[0]
-    j = king_pos[1]
-
-    def is_N_check(b,d):
-        if b < 0 or b >= 8 or d < 0 or d >= 8:
-            return False
-        pc = board[b][d]
-        sym = pc.symbol
-        pc_color = pc.color
-        if sym == 'E':
-            return False
-        if sym == 'N' and pc_color != color:
+    for (i, j, _) in KNIGHT_TARGETS[king_pos[0]][king_pos[1]]:
+        pc = board[i][j]
+        if pc.symbol == 'N' and pc.color != color:
             return True
-        else:
-            return False
-    
-    if is_N_check(i - 2, j + 1):
-        return True
-    
-    if is_N_check(i - 2, j - 1):
-        return True
-    
-    if is_N_check(i - 1, j - 2):
-        return True
-    
-    if is_N_check(i - 1, j + 2):
-        return True
-    
-    if is_N_check(i + 1, j - 2):
-        return True
-    
-    if is_N_check(i + 1, j + 2):
-        return True
-    
-    if is_N_check(i + 2, j - 1):
-        return True
-    
-    if is_N_check(i + 2, j + 1):
-        return True
-    
     return False
 
 
 def is_pawn_check(board, color, king_pos):
-    for i in [-1, 1]:
-        for j in [-1, 1]:
-            if king_pos[0] + i < 0 or king_pos[0] + i >= 8 or king_pos[1] + j < 0 or king_pos[1] + j >= 8:
-                continue
-            pc = board[king_pos[0] + i][king_pos[1] + j]
-            sym = pc.symbol
-            pc_color = pc.color
-            if sym == 'E':
-                continue
-            if pc_color == color:
-                continue
-            if sym == 'P':
-                if color == 'W':
-                    if king_pos[0] < king_pos[0] + i:
-                        continue
-                    else:
-                        return True
-                else:
-                    if king_pos[0] > king_pos[0] + i:
-                        continue
-                    else:
-                        return True
+    if color == 'W':
+        attackers = PAWN_ATTACKERS['B'][king_pos[0]][king_pos[1]]
+    else:
+        attackers = PAWN_ATTACKERS['W'][king_pos[0]][king_pos[1]]
+
+    for (i, j, _) in attackers:
+        pc = board[i][j]
+        if pc.symbol == 'P' and pc.color != color:
+            return True
     return False
 
 
 def is_king_check(board, color, king_pos):
-    mvs = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1]]
-    for mv in mvs:
-        if king_pos[0] + mv[0] < 0 or king_pos[0] + mv[0] > 7 or king_pos[1] + mv[1] < 0  or  king_pos[1] + mv[1] > 7:
-            continue
-        pc = board[king_pos[0] + mv[0]][king_pos[1] + mv[1]]
-        sym = pc.symbol
-        pc_color = pc.color
-        if pc_color != color and sym ==  'K':
+    for (i, j, _) in KING_TARGETS[king_pos[0]][king_pos[1]]:
+        pc = board[i][j]
+        if pc.symbol == 'K' and pc.color != color:
             return True
     return False
 
@@ -181,14 +149,90 @@ def is_king_check(board, color, king_pos):
 def is_check(board, color, king_pos):
     if is_eight_way_check(board, color, king_pos):
         return True
-    
+
     if is_knight_check(board, color, king_pos):
         return True
-    
+
     if is_pawn_check(board, color, king_pos):
         return True
-    
+
     if is_king_check(board, color, king_pos):
         return True
-    
+
     return False
+
+
+# Static exchange evaluation
+def _first_on_ray(board, ray, removed):
+    for (i, j, _) in ray:
+        if (i, j) in removed:
+            continue
+        if board[i][j].symbol != 'E':
+            return i, j
+    return None
+
+
+def least_valuable_attacker(board, color, pos, values, removed=()):
+    """
+        Square of the cheapest piece of the given color attacking pos, pieces on the
+        removed squares are treated as gone so that x-ray attackers behind them show up
+    """
+    best = None
+    best_value = None
+
+    def consider(i, j, symbols):
+        nonlocal best, best_value
+        pc = board[i][j]
+        if pc.symbol in symbols and pc.color == color and (i, j) not in removed:
+            if best is None or values[pc.name] < best_value:
+                best = [i, j]
+                best_value = values[pc.name]
+
+    for (i, j, _) in PAWN_ATTACKERS[color][pos[0]][pos[1]]:
+        consider(i, j, 'P')
+    for (i, j, _) in KNIGHT_TARGETS[pos[0]][pos[1]]:
+        consider(i, j, 'N')
+    for ray in DIAGONAL_RAYS[pos[0]][pos[1]]:
+        first = _first_on_ray(board, ray, removed)
+        if first is not None:
+            consider(first[0], first[1], 'BQ')
+    for ray in STRAIGHT_RAYS[pos[0]][pos[1]]:
+        first = _first_on_ray(board, ray, removed)
+        if first is not None:
+            consider(first[0], first[1], 'RQ')
+    for (i, j, _) in KING_TARGETS[pos[0]][pos[1]]:
+        consider(i, j, 'K')
+
+    return best
+
+
+def static_exchange(board, move, values):
+    """
+        Material the side making the capture wins once every capture on the target square
+        has been played out, cheapest attacker first, with either side free to stop.
+        values maps piece names to their worth, pins are ignored.
+    """
+    from_pos, to_pos = move_positions(move)
+    mover = board[from_pos[0]][from_pos[1]]
+    victim = board[to_pos[0]][to_pos[1]]
+    if move & EN_PASSANT:
+        gain = [values["pawn"]]
+    else:
+        gain = [values[victim.name]]
+
+    removed = {(from_pos[0], from_pos[1])}
+    on_square = values[mover.name]
+    color = "B" if mover.color == "W" else "W"
+
+    while True:
+        attacker = least_valuable_attacker(board, color, to_pos, values, removed)
+        if attacker is None:
+            break
+        gain.append(on_square - gain[-1])
+        on_square = values[board[attacker[0]][attacker[1]].name]
+        removed.add((attacker[0], attacker[1]))
+        color = "B" if color == "W" else "W"
+
+    for d in range(len(gain) - 1, 0, -1):
+        gain[d - 1] = -max(-gain[d - 1], gain[d])
+    return gain[0]
@@ -0,0 +1,113 @@
+"""
+    Move generator test and benchmark. perft counts the leaf nodes of the legal move tree
+    to a fixed depth, the suite compares the counts of standard positions against their
+    known values, which catches bugs in castling, en passant and promotions, and reports
+    the nodes per second of each position.
+
+    python perft.py --suite [--bitboard] [--max-nodes N]
+    python perft.py --depth 4 [--fen FEN] [--divide] [--bitboard]
+    Reference: https://www.chessprogramming.org/Perft_Results
+"""
+import argparse
+import sys
+import time
+
+from bitboard import BitboardGame
+from chessgame import START_FEN, ChessGame
+from moves import move_name
+
+
+# (name, FEN, expected leaf nodes by depth)
+PERFT_SUITE = [
+    ("start", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594})
+]
+
+
+def perft(game, depth):
+    moves = game.generate_all_possible_moves(game.side_to_move())
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        info = game.handle_move(move)
+        nodes += perft(game, depth - 1)
+        game.unmake_move(move, info)
+    return nodes
+
+
+def divide(game, depth):
+    """
+        Prints the leaf nodes below every root move, to find the move a wrong count comes from
+    """
+    total = 0
+    for move in game.generate_all_possible_moves(game.side_to_move()):
+        if depth > 1:
+            info = game.handle_move(move)
+            nodes = perft(game, depth - 1)
+            game.unmake_move(move, info)
+        else:
+            nodes = 1
+        print(move_name(move) + ":", nodes)
+        total += nodes
+    print("Total:", total)
+    return total
+
+
+def run_suite(game_class=ChessGame, max_nodes=500000):
+    """
+        Runs every depth of PERFT_SUITE expected to take at most max_nodes leaf nodes,
+        returns the number of wrong counts
+    """
+    failures = 0
+    for name, fen, expected_counts in PERFT_SUITE:
+        for depth, expected in sorted(expected_counts.items()):
+            if expected > max_nodes:
+                break
+            game = game_class.from_fen(fen)
+            start = time.time()
+            nodes = perft(game, depth)
+            elapsed = time.time() - start
+
+            status = "ok" if nodes == expected else "FAILED (expected %d)" % expected
+            if nodes != expected:
+                failures += 1
+            print("%-10s depth %d: %9d nodes %8.2f s %9d nodes/s  %s" % (name, depth, nodes, elapsed, nodes / max(elapsed, 1e-9), status))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Perft move generator test")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--suite", action="store_true", help="run the standard positions instead")
+    parser.add_argument("--max-nodes", type=int, default=500000, help="largest suite count to run")
+    parser.add_argument("--bitboard", action="store_true", help="test BitboardGame instead of ChessGame")
+    args = parser.parse_args()
+
+    game_class = BitboardGame if args.bitboard else ChessGame
+
+    if args.suite:
+        sys.exit(1 if run_suite(game_class, args.max_nodes) else 0)
+
+    game = game_class.from_fen(args.fen)
+    start = time.time()
+    if args.divide:
+        nodes = divide(game, args.depth)
+    else:
+        nodes = perft(game, args.depth)
+        print("Nodes:", nodes)
+    elapsed = time.time() - start
+    print("Time: %.2f s, %d nodes/s" % (elapsed, nodes / max(elapsed, 1e-9)))
@@ -1,5 +1,6 @@
-from moves import is_check
-from utils import generate_diagonal_indexes, generate_translational_indexes
+from attacks import DIAGONAL_RAYS, KING_TARGETS, KNIGHT_TARGETS, STRAIGHT_RAYS, pos_to_square, square_to_pos
+from moves import (BLACK_KINGSIDE, BLACK_QUEENSIDE, CAPTURE, CASTLE, DOUBLE_PUSH, EN_PASSANT, PIECE_SYMBOLS,
+                   WHITE_KINGSIDE, WHITE_QUEENSIDE, is_check)
 
 
 class Piece():
@@ -11,7 +12,6 @@ class Piece():
         self.pos = pos
         self.alive = True
         self.king = king
-        self.history = [(pos, 0)]
 
     def captured(self):
         self.alive = False
@@ -29,22 +29,34 @@ class Piece():
         old_pos = list(self.pos)
         self.pos = [i, j]
         return old_pos
-    
-    def update_history(self, pos, total_moves):
-        self.history.append((pos, total_moves))
+
+    def clone(self, king):
+        """
+            A copy of the piece that belongs to king, see ChessGame.copy
+        """
+        piece = type(self)(self.name, self.symbol, self.color, list(self.pos), king)
+        piece.alive = self.alive
+        return piece
+
+
+# Placeholder for squares that are only emptied temporarily
+EMPTY_SQUARE = Piece("empty", "E", "E", None, None)
 
 
 class ChessPiece(Piece):
     
-    def promote(self):
-        self.name = "queen"
-        self.symbol = "Q"
+    def promote(self, name="queen"):
+        self.name = name
+        self.symbol = PIECE_SYMBOLS[name]
     
     def unpromote(self):
         self.name = "pawn"
         self.symbol = "P"
 
-    def is_king_safe(self, move, board):
+    def is_king_safe(self, move, board, captured_pos=None):
+        """
+            captured_pos is the square of a pawn taken en passant, it is lifted off the board for the test
+        """
         if self.name == "king":
             king_pos = [self.pos[0] + move[0], self.pos[1] + move[1]]
         else:
@@ -53,385 +65,181 @@ class ChessPiece(Piece):
         
         og_piece = board[next_pos[0]][next_pos[1]]
         board[next_pos[0]][next_pos[1]] = board[self.pos[0]][self.pos[1]]
-        board[self.pos[0]][self.pos[1]] = Piece("empty", "E", "E", None, None)
+        board[self.pos[0]][self.pos[1]] = EMPTY_SQUARE
+        if captured_pos is not None:
+            captured_pc = board[captured_pos[0]][captured_pos[1]]
+            board[captured_pos[0]][captured_pos[1]] = EMPTY_SQUARE
 
         king_check = is_check(board, self.color, king_pos)
 
+        if captured_pos is not None:
+            board[captured_pos[0]][captured_pos[1]] = captured_pc
         board[self.pos[0]][self.pos[1]] = board[next_pos[0]][next_pos[1]]
         board[next_pos[0]][next_pos[1]] = og_piece
 
         return not king_check
 
+    def is_pseudo_legal(self, move, board, captured_pos=None):
+        """
+            Stands in for is_king_safe when generating pseudo-legal moves
+        """
+        return True
+
+    def slide(self, board, rays, from_bits, moves, king_safe):
+        """
+            Appends the moves along precomputed rays, from_bits is the mover's square shifted into place
+        """
+        i, j = self.pos
+        for ray in rays:
+            for (y, x, square) in ray:
+                pc = board[y][x]
+                if pc.symbol != 'E' and pc.color == self.color:
+                    break
+                if king_safe([y - i, x - j], board):
+                    if pc.symbol != 'E':
+                        moves.append(from_bits | square | CAPTURE)
+                    else:
+                        moves.append(from_bits | square)
+                if pc.symbol != 'E':
+                    break
+
+    def step(self, board, targets, from_bits, moves, king_safe):
+        i, j = self.pos
+        for (y, x, square) in targets:
+            pc = board[y][x]
+            if pc.symbol != 'E' and pc.color == self.color:
+                continue
+            if king_safe([y - i, x - j], board):
+                if pc.symbol != 'E':
+                    moves.append(from_bits | square | CAPTURE)
+                else:
+                    moves.append(from_bits | square)
+
+    def add_pawn_move(self, move, moves, flags):
+        """
+            Reaching the last rank adds one move per promotion piece, queen first
+        """
+        if (move & 0x3f) < 8 or (move & 0x3f) >= 56:
+            for promotion in (4, 1, 3, 2):
+                moves.append(move | (promotion << 12) | flags)
+        else:
+            moves.append(move | flags)
+
     def check_for_enpassant(self, state):
+        """
+            state['ep_square'] is the square a pawn that has just moved two squares passed over
+        """
         assert self.name == "pawn"
 
-        board = state['board']
-        total_moves = state['total_moves']
+        ep_square = state['ep_square']
+        if ep_square is None:
+            return []
 
         i = self.pos[0]
         j = self.pos[1]
-
-        enpassants = []
+        ep_pos = square_to_pos(ep_square)
 
         if self.color == "W":
-            if (i == 3 and j - 1 >= 0 and
-                board[i - 1][j - 1].symbol == 'E' and
-                board[i][j - 1].symbol == 'P' and board[i][j - 1].color != 'W'):
-                # en passant
-                if board[i][j - 1].history[-1][1] == total_moves and board[i][j - 1].history[-2][0][0] == 1:
-                    enpassants.append([-1, -1])
-            if (i == 3 and j + 1 <= 7 and
-                board[i - 1][j + 1].symbol == 'E' and
-                board[i][j + 1].symbol == 'P' and board[i][j + 1].color != 'W'):
-                # en passant
-                if board[i][j + 1].history[-1][1] == total_moves and board[i][j+ 1].history[-2][0][0] == 1:
-                    enpassants.append([-1, 1])
+            forward, row = -1, 3
         else:
-            if (i == 4 and j - 1 >= 0 and
-                board[i + 1][j - 1].symbol == 'E' and
-                board[i][j - 1].symbol == 'P' and board[i][j - 1].color != 'B'):
-                # en passant
-                if board[i][j - 1].history[-1][1] == total_moves and board[i][j - 1].history[-2][0][0] == 6:
-                    enpassants.append([1, -1])
-            if (i == 4 and j + 1 <= 7 and
-                board[i + 1][j + 1].symbol == 'E' and
-                board[i][j + 1].symbol == 'P' and board[i][j + 1].color != 'B'):
-                # en passant
-                if board[i][j + 1].history[-1][1] == total_moves and board[i][j+ 1].history[-2][0][0] == 6:
-                    enpassants.append([1, 1])
-                
-        return enpassants
+            forward, row = 1, 4
+
+        if i == row and ep_pos[0] == i + forward and abs(ep_pos[1] - j) == 1:
+            return [[forward, ep_pos[1] - j]]
+        return []
 
     def get_castling_rights(self, state):
         assert self.name == "king"
 
-        board = state['board']
-        total_moves = state['total_moves']
-
-        i = self.pos[0]
-        j = self.pos[1]
-        
-        castling = [False, False]   # queenside, kingside
+        castling = state['castling']
 
         if self.color == "W":
-            if len(self.history) == 1 and board[7][7].symbol == "R" and len(board[7][7].history) == 1:
-                castling[1] = True
-            
-            if len(self.history) == 1 and board[7][0].symbol == "R" and len(board[7][0].history) == 1:
-                castling[0] = True
-        
-        if self.color == "B":
-            if len(self.history) == 1 and board[0][7].symbol == "R" and len(board[0][7].history) == 1:
-                castling[1] = True
-            
-            if len(self.history) == 1 and board[0][0].symbol == "R" and len(board[0][0].history) == 1:
-                castling[0] = True
-        
-        return castling
+            return [bool(castling & WHITE_QUEENSIDE), bool(castling & WHITE_KINGSIDE)]   # queenside, kingside
+        else:
+            return [bool(castling & BLACK_QUEENSIDE), bool(castling & BLACK_KINGSIDE)]
 
-    def get_possible_moves(self, state):
+    def get_possible_moves(self, state, legal=True):
         """
-            Get all possible moves for the piece
-            Does not account for checks. So perform check after this.
+            Get all possible moves for the piece as packed ints, see moves.encode_move
+            With legal=False the moves are only pseudo-legal: moves that leave the king
+            in check are kept (castling is still fully checked) and ChessGame.is_legal
+            has to be asked before making them.
         """
         board = state['board']
-        total_moves = state['total_moves']
+
+        if legal:
+            king_safe = self.is_king_safe
+        else:
+            king_safe = self.is_pseudo_legal
+
+        moves = []
+
+        if not self.alive:
+            return moves
 
         i = self.pos[0]
         j = self.pos[1]
+        square = pos_to_square(self.pos)
+        from_bits = square << 6
 
         if self.name == "pawn":
-            possible_moves = [None, None, None, None, None, None]
-            possible_moves_mask = [False, False, False, False, False, False]
-            is_capture = [False, False, False, False, False, False]
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
             if self.color == "W":
-                if i - 1 >= 0 and board[i - 1][j].symbol == 'E' and self.is_king_safe([-1, 0], board):
-                    possible_moves[0] = [-1, 0]
-                    possible_moves_mask[0] = True
-                if i - 1 >= 0 and j + 1 <=  7 and board[i - 1][j + 1].symbol != 'E' and board[i - 1][j + 1].color != 'W' and self.is_king_safe([-1, 1], board):
-                    possible_moves[1] = [-1, 1]
-                    possible_moves_mask[1] = True
-                    is_capture[1] = True
-                if i - 1 >= 0 and j - 1 >= 0 and board[i - 1][j - 1].symbol != 'E' and board[i - 1][j - 1].color != 'W' and self.is_king_safe([-1, -1], board):
-                    possible_moves[2] = [-1, -1]
-                    possible_moves_mask[2] = True
-                    is_capture[2] = True
-                if i == 6:
-                    if i - 2 >= 0 and board[i - 2][j].symbol == 'E' and self.is_king_safe([-2, 0], board):
-                        possible_moves[3] = [-2, 0]
-                        possible_moves_mask[3] = True
-                if (i == 3 and j - 1 >= 0 and
-                    board[i - 1][j - 1].symbol == 'E' and
-                    self.is_king_safe([-1, -1], board) and
-                    board[i][j - 1].symbol == 'P' and board[i][j - 1].color != 'W'):
-                    # en passant
-                    if board[i][j - 1].history[-1][1] == total_moves and board[i][j - 1].history[-2][0][0] == 1:
-                        possible_moves[4] = [-1, -1]
-                        possible_moves_mask[4] = True
-                        is_capture[4] = True
-                if (i == 3 and j + 1 <= 7 and
-                    board[i - 1][j + 1].symbol == 'E' and
-                    self.is_king_safe([-1, 1], board) and
-                    board[i][j + 1].symbol == 'P' and board[i][j + 1].color != 'W'):
-                    # en passant
-                    if board[i][j + 1].history[-1][1] == total_moves and board[i][j+ 1].history[-2][0][0] == 1:
-                        possible_moves[5] = [-1, 1]
-                        possible_moves_mask[5] = True
-                        is_capture[5] = True
+                forward, start_row, push = -1, 6, 8
             else:
-                if i + 1 <= 7 and board[i + 1][j].symbol == 'E' and self.is_king_safe([1, 0], board):
-                    possible_moves[0] = [1, 0]
-                    possible_moves_mask[0] = True
-                if i + 1 <= 7 and j + 1 <= 7 and board[i + 1][j + 1].symbol != 'E' and board[i + 1][j + 1].color != 'B' and self.is_king_safe([1, 1], board):
-                    possible_moves[1] = [1, 1]
-                    possible_moves_mask[1] = True
-                    is_capture[1] = True
-                if i + 1 <= 7 and j - 1 >= 0 and board[i + 1][j - 1].symbol != 'E' and board[i + 1][j - 1].color != 'B' and self.is_king_safe([1, -1], board):
-                    possible_moves[2] = [1, -1]
-                    possible_moves_mask[2] = True
-                    is_capture[2] = True
-                if i == 1:
-                    if i + 2 <= 7 and board[i + 2][j].symbol == 'E' and self.is_king_safe([2, 0], board):
-                        possible_moves[3] = [2, 0]
-                        possible_moves_mask[3] = True
-                if (i == 4 and j - 1 >= 0 and
-                    board[i + 1][j - 1].symbol == 'E' and
-                    self.is_king_safe([1, -1], board) and
-                    board[i][j - 1].symbol == 'P' and board[i][j - 1].color != 'B'):
-                    # en passant
-                    if board[i][j - 1].history[-1][1] == total_moves and board[i][j - 1].history[-2][0][0] == 6:
-                        possible_moves[4] = [1, -1]
-                        possible_moves_mask[4] = True
-                        is_capture[4] = True
-                if (i == 4 and j + 1 <= 7 and
-                    board[i + 1][j + 1].symbol == 'E' and
-                    self.is_king_safe([1, 1], board) and
-                    board[i][j + 1].symbol == 'P' and board[i][j + 1].color != 'B'):
-                    # en passant
-                    if board[i][j + 1].history[-1][1] == total_moves and board[i][j+ 1].history[-2][0][0] == 6:
-                        possible_moves[5] = [1, 1]
-                        possible_moves_mask[5] = True
-                        is_capture[5] = True
-        
-        if self.name == "rook":
-            possible_moves = [None for _ in range(7 + 7)]
-            possible_moves_mask = [False for _ in range(7 + 7)]
-            is_capture = [False for _ in range(7 + 7)]
-            mv_id = 0
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
-            def rook_move(sym, move, mv_id, cl):
-                if sym == 'E' and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                if sym != 'E' and cl != self.color and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                    is_capture[mv_id] = True
-            
-            vert_indexes = generate_translational_indexes(i)
-
-            for vert_index in vert_indexes:
-                occluded = False
-                for y in vert_index:
-                    if not occluded:
-                        sym = board[y][j].symbol
-                        cl = board[y][j].color
-                        move = [y - i, 0]
-                        rook_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
+                forward, start_row, push = 1, 1, -8
+
+            if 0 <= i + forward <= 7:
+                if board[i + forward][j].symbol == 'E':
+                    if king_safe([forward, 0], board):
+                        self.add_pawn_move(from_bits | (square + push), moves, 0)
+                    if i == start_row and board[i + 2 * forward][j].symbol == 'E' and king_safe([2 * forward, 0], board):
+                        moves.append(from_bits | (square + 2 * push) | DOUBLE_PUSH)
+                for dj in (1, -1):
+                    if 0 <= j + dj <= 7:
+                        pc = board[i + forward][j + dj]
+                        if pc.symbol != 'E' and pc.color != self.color and king_safe([forward, dj], board):
+                            self.add_pawn_move(from_bits | (square + push + dj), moves, CAPTURE)
+
+            for move in self.check_for_enpassant(state):
+                if king_safe(move, board, [i, j + move[1]]):
+                    moves.append(from_bits | (square + push + move[1]) | CAPTURE | EN_PASSANT)
 
-            hori_indexes = generate_translational_indexes(j)
+        if self.name == "rook":
+            self.slide(board, STRAIGHT_RAYS[i][j], from_bits, moves, king_safe)
 
-            for hori_index in hori_indexes:
-                occluded = False
-                for x in hori_index:
-                    if not occluded:
-                        sym = board[i][x].symbol
-                        cl = board[i][x].color
-                        move = [0, x - j]
-                        rook_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
-        
         if self.name == "bishop":
-            possible_moves = [None for _ in range(7 + 7)]
-            possible_moves_mask = [False for _ in range(7 + 7)]
-            is_capture = [False for _ in range(7 + 7)]
-            mv_id = 0
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
-            def bishop_move(sym, move, mv_id, cl):
-                if sym == 'E' and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                if sym != 'E' and cl != self.color and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                    is_capture[mv_id] = True
-            
-            diagonal_indexes = generate_diagonal_indexes(i, j)
-
-            for diagonal_index in diagonal_indexes:
-                occluded = False
-                for (y, x) in diagonal_index:
-                    if not occluded:
-                        sym = board[y][x].symbol
-                        cl = board[y][x].color
-                        move = [y - i, x - j]
-                        bishop_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
+            self.slide(board, DIAGONAL_RAYS[i][j], from_bits, moves, king_safe)
 
         if self.name == "queen":
-            possible_moves = [None for _ in range(7 * 8)]
-            possible_moves_mask = [False for _ in range(7 * 8)]
-            is_capture = [False for _ in range(7 * 8)]
-            mv_id = 0
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
-            def queen_move(sym, move, mv_id, cl):
-                if sym == 'E' and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                if sym != 'E' and cl != self.color and self.is_king_safe(move, board):
-                    possible_moves[mv_id] = move
-                    possible_moves_mask[mv_id] = True
-                    is_capture[mv_id] = True
-            
-            vert_indexes = generate_translational_indexes(i)
-
-            for vert_index in vert_indexes:
-                occluded = False
-                for y in vert_index:
-                    if not occluded:
-                        sym = board[y][j].symbol
-                        cl = board[y][j].color
-                        move = [y - i, 0]
-                        queen_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
+            self.slide(board, STRAIGHT_RAYS[i][j], from_bits, moves, king_safe)
+            self.slide(board, DIAGONAL_RAYS[i][j], from_bits, moves, king_safe)
 
-            hori_indexes = generate_translational_indexes(j)
-
-            for hori_index in hori_indexes:
-                occluded = False
-                for x in hori_index:
-                    if not occluded:
-                        sym = board[i][x].symbol
-                        cl = board[i][x].color
-                        move = [0, x - j]
-                        queen_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
-        
-            diagonal_indexes = generate_diagonal_indexes(i, j)
-
-            for diagonal_index in diagonal_indexes:
-                occluded = False
-                for (y, x) in diagonal_index:
-                    if not occluded:
-                        sym = board[y][x].symbol
-                        cl = board[y][x].color
-                        move = [y - i, x - j]
-                        queen_move(sym, move, mv_id, cl)
-                        if sym != 'E':
-                            occluded = True
-                    mv_id += 1
-        
         if self.name == "knight":
-            possible_moves = [
-                [-2, 1], [-2, -1], [-1, -2], [-1, 2], [1, -2], [1, 2], [2, -1], [2, 1]
-            ]
-            possible_moves_mask = [False for _ in range(8)]
-            is_capture = [False for _ in range(8)]
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
-            def knight_move(sym, move, mv_id, cl):
-                if sym == 'E' and self.is_king_safe(move, board):
-                    possible_moves_mask[mv_id] = True
-                if sym != 'E' and cl != self.color and self.is_king_safe(move, board):
-                    possible_moves_mask[mv_id] = True
-                    is_capture[mv_id] = True
-
-            for idx in range(8):
-                move = possible_moves[idx]
-                if i + move[0] >= 0 and i + move[0] <= 7 and j + move[1] >= 0 and j + move[1] <= 7:
-                    sym = board[i + move[0]][j + move[1]].symbol
-                    cl = board[i + move[0]][j + move[1]].color
-                    knight_move(sym, move, idx, cl)
-           
+            self.step(board, KNIGHT_TARGETS[i][j], from_bits, moves, king_safe)
+
         if self.name == "king":
-            possible_moves = [[-1, -1], [-1, 0], [0, -1], [1, 1], [1, 0], [0, 1], [-1, 1], [1, -1], [0, 6 - j], [0, 2 - j]]
-            possible_moves_mask = [False for _ in range(10)]
-            is_capture = [False for _ in range(10)]
-
-            if not self.alive:
-                return possible_moves, possible_moves_mask, is_capture
-
-            def king_move(sym, move, mv_id, cl):
-                if sym == 'E' and self.is_king_safe(move, board):
-                    possible_moves_mask[mv_id] = True
-                if sym != 'E' and cl != self.color and self.is_king_safe(move, board):
-                    possible_moves_mask[mv_id] = True
-                    is_capture[mv_id] = True
-            
-            for idx in range(8):
-                move = possible_moves[idx]
-                if i + move[0] >= 0 and i + move[0] <= 7 and j + move[1] >= 0 and j + move[1] <= 7:
-                    sym = board[i + move[0]][j + move[1]].symbol
-                    cl = board[i + move[0]][j + move[1]].color
-                    king_move(sym, move, idx, cl)
-            
+            self.step(board, KING_TARGETS[i][j], from_bits, moves, king_safe)
+
             if self.color == "W":
-                if self.is_king_safe([0, 0], board) and len(self.history) == 1:
-                    if board[7][7].symbol == "R" and len(board[7][7].history) == 1:
-                        occluded = False
-                        for ep in range(5, 7):
-                            if board[7][ep].symbol != 'E' or not self.is_king_safe([0, ep - j], board):
-                                occluded = True
-                        if not occluded:
-                            possible_moves_mask[8] = True
-                    if board[7][0].symbol == "R" and len(board[7][0].history) == 1:
-                        occluded = False
-                        for ep in range(1, 4):
-                            if board[7][ep].symbol != 'E' or not self.is_king_safe([0, ep - j], board):
-                                occluded = True
-                        if not occluded:
-                            possible_moves_mask[9] = True
+                row = 7
             else:
-                if self.is_king_safe([0, 0], board) and len(self.history) == 1:
-                    if board[0][7].symbol == "R" and len(board[0][7].history) == 1:
-                        occluded = False
-                        for ep in range(5, 7):
-                            if board[0][ep].symbol != 'E' or not self.is_king_safe([0, ep - j], board):
-                                occluded = True
-                        if not occluded:
-                            possible_moves_mask[8] = True
-                    if board[0][0].symbol == "R" and len(board[0][0].history) == 1:
-                        occluded = False
-                        for ep in range(1, 4):
-                            if board[0][ep].symbol != 'E' or not self.is_king_safe([0, ep - j], board):
-                                occluded = True
-                        if not occluded:
-                            possible_moves_mask[9] = True
-        
-        return possible_moves, possible_moves_mask, is_capture
+                row = 0
+
+            castling = self.get_castling_rights(state)
+            if (castling[0] or castling[1]) and self.is_king_safe([0, 0], board):
+                if castling[1]:
+                    occluded = False
+                    for ep in range(5, 7):
+                        if board[row][ep].symbol != 'E' or not self.is_king_safe([0, ep - j], board):
+                            occluded = True
+                    if not occluded:
+                        moves.append(from_bits | (square + 2) | CASTLE)
+                if castling[0]:
+                    occluded = False
+                    for ep in range(1, 4):
+                        if board[row][ep].symbol != 'E' or (ep > 1 and not self.is_king_safe([0, ep - j], board)):
+                            occluded = True
+                    if not occluded:
+                        moves.append(from_bits | (square - 2) | CASTLE)
+
+        return moves